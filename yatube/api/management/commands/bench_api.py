@@ -0,0 +1,81 @@
+import tempfile
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.bench import measure, summary, temporary_database
+from posts.models import Post
+from posts.seeding import seed_feeds
+
+
+def content_length(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает JSON API с HTML-страницами тех же данных: '
+            'p50/p95 и размер ответа на временной БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20_000)
+        parser.add_argument('--comments', type=int, default=50_000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый адрес')
+
+    def handle(self, *args, **options):
+        with ExitStack() as stack:
+            media = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(override_settings(MEDIA_ROOT=media))
+            stack.enter_context(temporary_database())
+            self.stdout.write('Заполняем базу...')
+            seed_feeds(options['users'], options['groups'],
+                       options['posts'], comments=options['comments'],
+                       seed=options['seed'])
+            for name, html, api in self.pairs():
+                self.stdout.write(name)
+                for kind, url in (('html', html), ('api', api)):
+                    self.report(kind, url, options['requests'])
+
+    def pairs(self):
+        """Адрес HTML-страницы и адрес API с теми же данными."""
+        post = Post.objects.select_related('author', 'group').exclude(
+            group=None).first()
+        group = post.group
+        username = post.author.username
+        # Столько же постов, сколько на странице HTML
+        posts = reverse('api:post_list') + f'?limit={settings.QUANTITY}'
+        return (
+            ('Лента', reverse('posts:index'), posts),
+            ('Группа',
+             reverse('posts:posts_group', kwargs={'slug': group.slug}),
+             f'{posts}&group={group.slug}'),
+            ('Профиль',
+             reverse('posts:profile', kwargs={'username': username}),
+             f'{posts}&author={username}'),
+            ('Пост',
+             reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+             reverse('api:post_detail', kwargs={'post_id': post.pk})),
+        )
+
+    def report(self, kind, url, repeat):
+        client = Client()
+        sizes = []
+
+        def request():
+            # HTML-ленты кэшируются: сравниваем честный рендер
+            cache.clear()
+            sizes.append(content_length(client.get(url)))
+
+        timings = summary(measure(request, repeat))
+        self.stdout.write(
+            f"  {kind:4} p50 {timings['p50']:8.2f} мс  "
+            f"p95 {timings['p95']:8.2f} мс  {max(sizes)} байт  {url}")
@@ -0,0 +1,100 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def read_json(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return json.loads(response.content)
+
+
+@override_settings(API_PAGE_SIZE=3)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='api', description='Описание')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {number}',
+                                group=cls.group if number % 2 else None)
+            for number in range(7)
+        ]
+        Comment.objects.create(author=cls.reader, post=cls.posts[0],
+                               text='Первый')
+        Comment.objects.create(author=cls.reader, post=cls.posts[0],
+                               text='Второй')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def walk(self, url, **params):
+        """Все страницы списка по курсору next."""
+        results, after = [], ''
+        while True:
+            page = read_json(self.client.get(url, {**params, 'after': after}))
+            results.extend(page['results'])
+            after = page['next']
+            if after is None:
+                return results
+
+    def test_cursor_walks_all_posts_newest_first(self):
+        results = self.walk(reverse('api:post_list'))
+        self.assertEqual([row['id'] for row in results],
+                         [post.pk for post in reversed(self.posts)])
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse('api:post_list'),
+                                   {'fields': 'id,author'})
+        row = read_json(response)['results'][0]
+        self.assertEqual(row, {'id': self.posts[-1].pk, 'author': 'auth'})
+
+    def test_unknown_field_is_400(self):
+        response = self.client.get(reverse('api:post_list'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_group_filter(self):
+        results = self.walk(reverse('api:post_list'), group='api')
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(row['group'] == 'api' for row in results))
+
+    def test_post_detail(self):
+        post = self.posts[1]
+        url = reverse('api:post_detail', kwargs={'post_id': post.pk})
+        data = read_json(self.client.get(url))
+        self.assertEqual(data['text'], post.text)
+        self.assertEqual(data['group'], 'api')
+        missing = reverse('api:post_detail', kwargs={'post_id': 10 ** 6})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_comments_oldest_first(self):
+        url = reverse('api:comment_list',
+                      kwargs={'post_id': self.posts[0].pk})
+        results = read_json(self.client.get(url))['results']
+        self.assertEqual([row['text'] for row in results],
+                         ['Первый', 'Второй'])
+
+    def test_groups_and_follows(self):
+        groups = read_json(self.client.get(reverse('api:group_list')))
+        self.assertEqual(groups['results'][0]['slug'], 'api')
+        follows = read_json(self.client.get(reverse('api:follow_list'),
+                                            {'user': 'reader'}))
+        self.assertEqual(follows['results'],
+                         [{'id': follows['results'][0]['id'],
+                           'user': 'reader', 'author': 'auth'}])
+        response = self.client.get(reverse('api:follow_list'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            read_json(self.client.get(reverse('api:post_list')))
+        self.assertEqual(len(queries), 1)
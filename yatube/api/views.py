@@ -0,0 +1,190 @@
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import (ValuesCursorPaginator, decode_cursor,
+                              encode_cursor)
+from posts.storage import post_images
+
+
+def _image_url(name):
+    return post_images.url(name) if name else None
+
+
+# Имя поля в ответе -> путь для values() и (необязательно) преобразование
+POST_FIELDS = {
+    'id': ('pk', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', _image_url),
+}
+COMMENT_FIELDS = {
+    'id': ('pk', None),
+    'post': ('post_id', None),
+    'parent': ('parent_id', None),
+    'depth': ('depth', None),
+    'author': ('author__username', None),
+    'text': ('text', None),
+    'created': ('created', None),
+}
+GROUP_FIELDS = {
+    'id': ('pk', None),
+    'slug': ('slug', None),
+    'title': ('title', None),
+    'description': ('description', None),
+}
+FOLLOW_FIELDS = {
+    'id': ('pk', None),
+    'user': ('user__username', None),
+    'author': ('author__username', None),
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def api_view(view):
+    """Только чтение; ошибки отдаются в JSON, а не HTML-страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except InvalidQuery as error:
+            return JsonResponse({'detail': str(error)}, status=400)
+        except Http404:
+            return JsonResponse({'detail': 'Не найдено'}, status=404)
+    return wrapper
+
+
+def _fields(request, fields):
+    """Разреженный набор полей из ?fields=id,text; по умолчанию — все."""
+    names = request.GET.get('fields')
+    if not names:
+        return list(fields)
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise InvalidQuery(f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        raise InvalidQuery('limit должен быть числом')
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def _values(queryset, names, fields, *extra):
+    paths = dict.fromkeys([*(fields[name][0] for name in names), *extra])
+    return queryset.values(*paths)
+
+
+def _serialize(row, names, fields):
+    result = {}
+    for name in names:
+        path, convert = fields[name]
+        result[name] = convert(row[path]) if convert else row[path]
+    return result
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _stream(rows, names, fields, paginator=None):
+    """Пишем JSON по мере чтения строк из курсора БД.
+
+    Следующий курсор известен только в конце, поэтому "next"
+    идёт после "results".
+    """
+    yield '{"results": ['
+    last = None
+    more = False
+    for number, row in enumerate(rows):
+        if paginator is not None and number == paginator.per_page:
+            more = True
+            break
+        yield (',' if number else '') + _dumps(
+            _serialize(row, names, fields))
+        last = row
+    cursor = (encode_cursor(last[paginator.field], last['pk'])
+              if more else None)
+    yield '], "next": ' + _dumps(cursor) + '}'
+
+
+def _json_stream(chunks):
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+def _page(request, queryset, fields, field='pub_date', descending=True):
+    names = _fields(request, fields)
+    paginator = ValuesCursorPaginator(
+        _values(queryset, names, fields, field, 'pk'), _limit(request),
+        field, descending)
+    cursor = decode_cursor(request.GET.get('after'))
+    rows = paginator.ordered(cursor)[:paginator.per_page + 1]
+    return _json_stream(_stream(rows.iterator(), names, fields, paginator))
+
+
+@api_view
+def post_list(request):
+    posts = Post.objects.all()
+    if request.GET.get('group'):
+        posts = posts.filter(group__slug=request.GET['group'])
+    if request.GET.get('author'):
+        posts = posts.filter(author__username=request.GET['author'])
+    return _page(request, posts, POST_FIELDS)
+
+
+@api_view
+def post_detail(request, post_id):
+    names = _fields(request, POST_FIELDS)
+    row = _values(Post.objects.filter(pk=post_id), names,
+                  POST_FIELDS).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(_serialize(row, names, POST_FIELDS),
+                        encoder=DjangoJSONEncoder,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@api_view
+def comment_list(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = Comment.objects.filter(post_id=post_id)
+    return _page(request, comments, COMMENT_FIELDS, field='created',
+                 descending=False)
+
+
+@api_view
+def group_list(request):
+    names = _fields(request, GROUP_FIELDS)
+    rows = _values(Group.objects.order_by('pk'), names, GROUP_FIELDS)
+    return _json_stream(_stream(rows.iterator(), names, GROUP_FIELDS))
+
+
+@api_view
+def follow_list(request):
+    """Подписки одного читателя (?user=) или подписчики автора (?author=)."""
+    follows = Follow.objects.order_by('pk')
+    if request.GET.get('user'):
+        follows = follows.filter(user__username=request.GET['user'])
+    elif request.GET.get('author'):
+        follows = follows.filter(author__username=request.GET['author'])
+    else:
+        raise InvalidQuery('Укажите user или author')
+    names = _fields(request, FOLLOW_FIELDS)
+    rows = _values(follows, names, FOLLOW_FIELDS)
+    return _json_stream(_stream(rows.iterator(), names, FOLLOW_FIELDS))
@@ -0,0 +1,179 @@
+import json
+import resource
+import tempfile
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import URLPattern, reverse
+from sorl.thumbnail import default
+
+from core.bench import measure, summary, temporary_database
+from posts import urls as posts_urls
+from posts.models import Comment, Follow, Group, Post
+from posts.seeding import seed_feeds
+from users import urls as users_urls
+
+
+def peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def compare(base, new, threshold):
+    """Строки сравнения p95 и список маршрутов, ставших медленнее."""
+    lines, regressions = [], []
+    for name, result in sorted(new['routes'].items()):
+        old = base['routes'].get(name)
+        if old is None:
+            lines.append(f'{name:32} новый маршрут')
+            continue
+        delta = ((result['p95'] - old['p95']) / old['p95'] * 100
+                 if old['p95'] else 0.0)
+        mark = ''
+        if delta > threshold:
+            mark = '  <-- регрессия'
+            regressions.append(name)
+        lines.append(
+            f"{name:32} p95 {old['p95']:8.2f} -> {result['p95']:8.2f} мс "
+            f"({delta:+.1f}%), SQL {old['queries']} -> "
+            f"{result['queries']}{mark}"
+        )
+    return lines, regressions
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон всех адресов posts и users на временной БД '
+            'с отчётом p50/p95/p99, SQL-запросов и роста RSS в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20_000)
+        parser.add_argument('--comments', type=int, default=50_000)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--images', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на каждый адрес')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--output', default='bench.json')
+        parser.add_argument('--compare', nargs=2,
+                            metavar=('BASE', 'NEW'),
+                            help='Сравнить два JSON-файла и выйти')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Допустимый рост p95, %%')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], options['threshold'])
+        with ExitStack() as stack:
+            media = stack.enter_context(tempfile.TemporaryDirectory())
+            # Миниатюры — в потоке запроса: фоновый пул пережил бы
+            # временный MEDIA_ROOT
+            stack.enter_context(override_settings(MEDIA_ROOT=media,
+                                                  THUMBNAIL_WORKERS=0))
+            stack.enter_context(temporary_database())
+            self.stdout.write('Заполняем базу...')
+            seed_feeds(options['users'], options['groups'],
+                       options['posts'], options['follows'],
+                       options['comments'], options['images'],
+                       seed=options['seed'])
+            cache.clear()
+            default.kvstore.reset_stats()
+            # RSS после заполнения: дальше растёт только от запросов
+            baseline = peak_rss()
+            results = self.run(options)
+        report = {
+            'dataset': {key: options[key] for key in (
+                'users', 'groups', 'posts', 'comments', 'follows',
+                'images', 'seed', 'requests', 'cold')},
+            'routes': results,
+            'thumbnail_kvstore': default.kvstore.stats(),
+            'baseline_rss_kb': baseline,
+            'peak_rss_kb': peak_rss(),
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Результаты записаны в {options['output']}"))
+
+    def url_kwargs(self):
+        follow = Follow.objects.select_related('user', 'author').first()
+        post = Post.objects.exclude(image='').first() or Post.objects.first()
+        kwargs = {
+            'username': follow.author.username,
+            'slug': Group.objects.first().slug,
+            'post_id': post.pk,
+        }
+        comment = Comment.objects.filter(post=post).first()
+        if comment is not None:
+            kwargs['comment_id'] = comment.pk
+        return follow.user, kwargs
+
+    def routes(self, reader, kwargs):
+        """Пары (имя, адрес, клиент) для всех маршрутов приложений."""
+        member = Client()
+        member.force_login(reader)
+        guest = Client()
+        for namespace, module, client in (('posts', posts_urls, member),
+                                          ('users', users_urls, guest)):
+            for pattern in module.urlpatterns:
+                if not isinstance(pattern, URLPattern) or not pattern.name:
+                    continue
+                # Адреса с параметрами, которых нет в kwargs, пропускаем
+                converters = pattern.pattern.converters
+                if converters.keys() - kwargs.keys():
+                    continue
+                params = {name: kwargs[name] for name in converters}
+                name = f'{namespace}:{pattern.name}'
+                yield name, reverse(name, kwargs=params), client
+
+    def run(self, options):
+        reader, kwargs = self.url_kwargs()
+        results = {}
+        for name, url, client in self.routes(reader, kwargs):
+            counter = QueryCounter()
+            rss = peak_rss()
+            statuses = set()
+
+            def request():
+                if options['cold']:
+                    cache.clear()
+                with connection.execute_wrapper(counter):
+                    statuses.add(client.get(url).status_code)
+
+            timings = measure(request, options['requests'])
+            queries = round(counter.count / options['requests'], 1)
+            results[name] = {
+                'url': url,
+                'status': sorted(statuses),
+                'queries': queries,
+                # ru_maxrss — пик процесса: на сколько маршрут его поднял
+                'rss_growth_kb': peak_rss() - rss,
+                **summary(timings),
+            }
+            self.stdout.write(
+                f"{name:32} p50 {results[name]['p50']:8.2f} мс  "
+                f"p95 {results[name]['p95']:8.2f} мс  SQL {queries}")
+        return results
+
+    def compare(self, base_path, new_path, threshold):
+        with open(base_path) as base, open(new_path) as new:
+            lines, regressions = compare(json.load(base), json.load(new),
+                                         threshold)
+        self.stdout.write('\n'.join(lines))
+        if regressions:
+            raise CommandError(
+                f"Регрессии p95 больше {threshold}%: {', '.join(regressions)}")
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+class RequestTimings:
+    """Счётчики одного запроса: SQL, шаблоны и вьюха."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.view = 0.0
+        self.view_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: вызывается на каждый SQL-запрос
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    def header(self, total):
+        def ms(seconds):
+            return f'{seconds * 1000:.1f}'
+        return ', '.join((
+            f'db;dur={ms(self.db)};desc="{self.queries} queries"',
+            f'tpl;dur={ms(self.templates)}',
+            f'view;dur={ms(self.view)}',
+            f'total;dur={ms(total)}',
+        ))
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        timings = getattr(_local, 'timings', None)
+        # Вложенные include считаются в составе внешнего шаблона
+        if timings is None or context.template is not None:
+            return render(self, context)
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            timings.templates += time.perf_counter() - started
+    wrapper.timed = True
+    return wrapper
+
+
+class ServerTimingMiddleware:
+    """Отдаёт заголовок Server-Timing и пишет в лог медленные запросы."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+
+    def __call__(self, request):
+        timings = _local.timings = RequestTimings()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        finished = time.perf_counter()
+        if timings.view_started is not None:
+            timings.view = finished - timings.view_started
+        total = finished - started
+        response['Server-Timing'] = timings.header(total)
+        if total * 1000 >= settings.SLOW_REQUEST_THRESHOLD:
+            match = request.resolver_match
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.1f мс, SQL: %d за %.1f мс, '
+                'шаблоны: %.1f мс',
+                request.method, request.path,
+                match.view_name if match else '-',
+                total * 1000, timings.queries, timings.db * 1000,
+                timings.templates * 1000,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.view_started = time.perf_counter()
@@ -0,0 +1,14 @@
+from django.test.runner import DiscoverRunner
+
+from posts.buffers import flush_all
+
+
+class BufferedRunner(DiscoverRunner):
+    """Сбрасываем буферы счётчиков, пока тестовая база ещё жива.
+
+    Иначе остаток уходит в atexit, когда таблиц уже нет.
+    """
+
+    def teardown_databases(self, old_config, **kwargs):
+        flush_all()
+        super().teardown_databases(old_config, **kwargs)
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .bench import percentile
+from .management.commands.bench_yatube import compare
+
+
+class ServerTimingTests(TestCase):
+    def test_server_timing_header(self):
+        """Ответ содержит SQL, шаблоны, вьюху и общее время."""
+        response = self.client.get('/')
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'queries"', 'tpl;dur=', 'view;dur=',
+                       'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, header)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_is_logged_with_url_name(self):
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            self.client.get('/follow/')
+        self.assertIn('posts:follow_index', logs.output[0])
+
+
+class BenchTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_compare_flags_p95_regressions(self):
+        base = {'routes': {'posts:index': {'p95': 10.0, 'queries': 2}}}
+        new = {'routes': {'posts:index': {'p95': 12.0, 'queries': 2},
+                          'posts:trending': {'p95': 1.0, 'queries': 1}}}
+        _, regressions = compare(base, new, threshold=10)
+        self.assertEqual(regressions, ['posts:index'])
+        _, regressions = compare(base, new, threshold=25)
+        self.assertEqual(regressions, [])
+
+
+class BenchCommandTests(TestCase):
+    # Отдельная временная БД не нужна: тест и так идёт на тестовой
+    @mock.patch('core.management.commands.bench_yatube.temporary_database',
+                nullcontext)
+    def test_runs_every_route_on_tiny_dataset(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'bench.json')
+            call_command('bench_yatube', users=5, groups=2, posts=30,
+                         comments=20, follows=5, images=1, requests=1,
+                         output=output, stdout=StringIO())
+            with open(output) as report:
+                report = json.load(report)
+        self.assertIn('posts:comment_replies', report['routes'])
+        for name, result in report['routes'].items():
+            with self.subTest(name=name):
+                self.assertLess(max(result['status']), 500)
+                self.assertGreaterEqual(result['rss_growth_kb'], 0)
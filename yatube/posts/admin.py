@@ -1,16 +1,38 @@
 from django.contrib import admin
 
-from .models import Group, Post, Comment, Follow
+from . import hll, search
+from .models import Group, Post, Comment, Follow, VisitorSketch
+
+
+class DuplicateFilter(admin.SimpleListFilter):
+    title = 'почти дубль'
+    parameter_name = 'duplicate'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Да'), ('no', 'Нет'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(fingerprint__duplicate_of__isnull=False)
+        if self.value() == 'no':
+            return queryset.exclude(fingerprint__duplicate_of__isnull=False)
+        return queryset
 
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
+    list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'views',)
     list_editable = ('group',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('pub_date', DuplicateFilter)
     # Это свойство сработает для всех колонок: где пусто — там будет эта строка
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по FTS5-индексу, а не LIKE '%…%' по всей таблице
+        if not search_term:
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
+
 # При регистрации модели Post источником конфигурации для неё назначаем
 # класс PostAdmin
 
@@ -30,7 +52,26 @@ class GroupFollow(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+class VisitorSketchAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'day', 'visitors',)
+    list_filter = ('kind', 'day',)
+    search_fields = ('=object_id',)
+    actions = ('estimate_selected',)
+
+    def visitors(self, obj):
+        return hll.estimate([obj])
+    visitors.short_description = 'Уникальных читателей (≈)'
+
+    def estimate_selected(self, request, queryset):
+        # Скетчи объединяются: читатель нескольких дней считается раз
+        self.message_user(
+            request,
+            f'Уникальных читателей в выбранном: ≈{hll.estimate(queryset)}')
+    estimate_selected.short_description = 'Оценить уникальных вместе'
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, GroupComment)
 admin.site.register(Follow, GroupFollow)
+admin.site.register(VisitorSketch, VisitorSketchAdmin)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # Подключаем обработчики сигналов
+        from . import search, signals  # noqa: F401
+        # Миграции SQLite пересоздают posts_post и теряют триггеры поиска
+        post_migrate.connect(search.ensure_index, sender=self)
@@ -0,0 +1,233 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .hll import HyperLogLog
+from .models import Post, VisitorSketch
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких id в одном IN: предел переменных SQLite
+CHUNK_SIZE = 400
+
+
+class Buffer:
+    """Записи в памяти процесса со сбросом в БД пачкой.
+
+    Пачка пишется, когда набралось size записей или прошло interval
+    секунд с прошлого сброса; остаток сбрасывается при выходе процесса,
+    а при падении воркера теряется не больше одной пачки. Пороги по
+    умолчанию берутся из настроек с именами size_setting и
+    interval_setting.
+    """
+    size_setting = 'VIEW_BUFFER_SIZE'
+    interval_setting = 'VIEW_BUFFER_INTERVAL'
+
+    def __init__(self, size=None, interval=None):
+        self.size = size
+        self.interval = interval
+        self._pending = self._empty()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def _empty(self):
+        return {}
+
+    def _limits(self):
+        return (self.size or getattr(settings, self.size_setting),
+                self.interval or getattr(settings, self.interval_setting))
+
+    def _record(self, key, value):
+        size, interval = self._limits()
+        with self._lock:
+            self._put(self._pending, key, value)
+            self._total += 1
+            due = (self._total >= size
+                   or time.monotonic() - self._flushed >= interval)
+        if due:
+            # На пути запроса ошибку БД только пишем в лог: пачка уже
+            # возвращена в буфер и уйдёт со следующим сбросом
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Не удалось сбросить буфер %s',
+                                 type(self).__name__)
+
+    def clear(self):
+        with self._lock:
+            self._pending = self._empty()
+            self._total = 0
+
+    def flush(self):
+        """Пишем накопленное; возвращаем число обновлённых объектов.
+
+        DatabaseError пробрасывается вызывающему, записи при этом
+        возвращаются в буфер.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, self._empty()
+            total, self._total = self._total, 0
+            self._flushed = time.monotonic()
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except DatabaseError:
+            # БД занята: вернём записи, запишем со следующей пачкой
+            with self._lock:
+                for key, value in batch.items():
+                    self._put(self._pending, key, value)
+                self._total += total
+            raise
+        return len(batch)
+
+    def _put(self, batch, key, value):
+        raise NotImplementedError
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+
+class CounterBuffer(Buffer):
+    """Приращения счётчика: одним UPDATE ... CASE на пачку."""
+
+    def __init__(self, model, field, size=None, interval=None):
+        self.model = model
+        self.field = field
+        super().__init__(size, interval)
+
+    def _empty(self):
+        return Counter()
+
+    def _put(self, batch, key, value):
+        batch[key] += value
+
+    def add(self, pk, delta=1):
+        self._record(pk, delta)
+
+    def pending(self, pk):
+        """Ещё не записанные приращения: для приблизительного live-счёта."""
+        with self._lock:
+            return self._pending[pk]
+
+    def live(self, pk, stored):
+        return stored + self.pending(pk)
+
+    def _write(self, batch):
+        items = list(batch.items())
+        for start in range(0, len(items), CHUNK_SIZE):
+            chunk = items[start:start + CHUNK_SIZE]
+            # Одинаковые приращения — в одну ветку CASE
+            by_delta = defaultdict(list)
+            for pk, delta in chunk:
+                by_delta[delta].append(pk)
+            self.model.objects.filter(
+                pk__in=[pk for pk, _ in chunk]).update(**{
+                    self.field: Case(
+                        *(When(pk__in=pks, then=F(self.field) + delta)
+                          for delta, pks in by_delta.items()),
+                        default=F(self.field),
+                    )
+                })
+
+
+class SketchBuffer(Buffer):
+    """Читатели по (вид, id, день): в БД сливаются в скетчи HyperLogLog.
+
+    Несколько процессов пишут одни строки, поэтому запись — сравнение
+    с обменом: UPDATE проходит, только если скетч не изменился с
+    чтения; иначе перечитываем и объединяем заново. Объединение
+    идемпотентно, так что повтор ничего не считает дважды.
+    """
+    size_setting = 'VISITOR_BUFFER_SIZE'
+    interval_setting = 'VISITOR_BUFFER_INTERVAL'
+    attempts = 5
+
+    def _put(self, batch, key, value):
+        batch.setdefault(key, set()).update(value)
+
+    def add(self, visitor, day=None, **objects):
+        """visitor прочитал objects: post=id, group=id, author=id."""
+        day = day or timezone.localdate()
+        for kind, object_id in objects.items():
+            if object_id is not None:
+                self._record((kind, object_id, day), {visitor})
+
+    def _write(self, batch):
+        pending = {}
+        for key, visitors in batch.items():
+            sketch = HyperLogLog()
+            for visitor in visitors:
+                sketch.add(visitor)
+            pending[key] = sketch
+        for _ in range(self.attempts):
+            pending = self._merge(pending)
+            if not pending:
+                return
+        raise DatabaseError('Скетчи читателей меняются слишком часто')
+
+    def _rows(self, keys):
+        keys = list(keys)
+        rows = {}
+        # Цепочка OR в SQLite ограничена глубиной дерева выражений
+        for start in range(0, len(keys), CHUNK_SIZE // 2):
+            query = Q()
+            for kind, object_id, day in keys[start:start + CHUNK_SIZE // 2]:
+                query |= Q(kind=kind, object_id=object_id, day=day)
+            rows.update(((row.kind, row.object_id, row.day), row)
+                        for row in VisitorSketch.objects.filter(query))
+        return rows
+
+    def _merge(self, pending):
+        """Один проход сравнения с обменом; возвращает непрошедшие."""
+        # Недостающие строки заводим пустыми: дальше всё — UPDATE
+        VisitorSketch.objects.bulk_create(
+            (VisitorSketch(kind=kind, object_id=object_id, day=day,
+                           sketch=HyperLogLog().to_bytes())
+             for kind, object_id, day in pending),
+            ignore_conflicts=True)
+        rows = self._rows(pending)
+        conflicts = {}
+        for key, sketch in pending.items():
+            row = rows[key]
+            old = bytes(row.sketch)
+            merged = (HyperLogLog.from_bytes(old) | sketch).to_bytes()
+            if merged == old:
+                continue
+            if not VisitorSketch.objects.filter(
+                    pk=row.pk, sketch=old).update(sketch=merged):
+                conflicts[key] = sketch
+        return conflicts
+
+
+def visitor_id(request):
+    """Кто читает: пользователь, сессия или адрес с браузером."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return f'session:{session}'
+    return 'anon:{}:{}'.format(request.META.get('REMOTE_ADDR', ''),
+                               request.META.get('HTTP_USER_AGENT', ''))
+
+
+# Просмотры и читатели постов; остаток пишем при остановке воркера
+post_views = CounterBuffer(Post, 'views')
+post_visitors = SketchBuffer()
+
+
+@atexit.register
+def flush_all():
+    for buffer in (post_views, post_visitors):
+        try:
+            buffer.flush()
+        except DatabaseError:
+            logger.exception('Не удалось сбросить буфер при выходе')
@@ -0,0 +1,142 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from . import counters
+
+INDEX = 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def _version_key(scope):
+    # Хэш: слаги и юникодные имена не годятся в ключи memcached,
+    # а имя Counter ограничено 100 символами
+    return 'feed-version:' + hashlib.md5(scope.encode()).hexdigest()
+
+
+def versions(*scopes):
+    """Текущие версии областей одним запросом.
+
+    Версии лежат в Counter, а не в кэше: LocMemCache у каждого воркера
+    свой, и сброс из одного процесса не дошёл бы до остальных.
+    """
+    keys = {_version_key(scope): scope for scope in scopes}
+    found = counters.read(*keys)
+    return {scope: found[key] for key, scope in keys.items()}
+
+
+def bump(*scopes):
+    """Инвалидируем все страницы, закэшированные под этими областями."""
+    # Время в мс, а не +1: откатившаяся запись не вернёт версию,
+    # под которой уже закэширована страница с её данными
+    counters.advance([_version_key(scope) for scope in scopes],
+                     int(time.time() * 1000))
+
+
+def _page_key(request, scopes, per_user=True, csrf=False):
+    raw = '|'.join((
+        request.get_full_path(),
+        str(request.user.pk or 0) if per_user else '*',
+        # Токен в форме страницы: после входа Django его меняет, и
+        # закэшированная у клиента форма получила бы 403
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, '') if csrf else '',
+        *(f'{scope}={version}'
+          for scope, version in sorted(versions(*scopes).items())),
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _cacheable(request, response):
+    # Заглушки миниатюр не кэшируем ни у себя, ни у клиента
+    return (response.status_code == 200 and not response.cookies
+            and not getattr(request, 'thumbnails_pending', False))
+
+
+def _revalidate(request, scopes, per_user=True, csrf=False):
+    """Ключ страницы и готовый 304, если у клиента та же версия."""
+    page_key = _page_key(request, scopes, per_user, csrf)
+    etag = quote_etag(page_key)
+    return page_key, etag, get_conditional_response(request, etag=etag)
+
+
+def _set_etag(response, etag, per_user=True):
+    response['ETag'] = etag
+    if per_user:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+
+
+def conditional(get_scopes, csrf=False, on_request=None):
+    """Conditional GET: ETag из версий областей get_scopes.
+
+    Если клиент прислал тот же If-None-Match, отвечаем 304, не трогая
+    ни запросы страницы, ни шаблон: нужен только запрос версий.
+    csrf=True — для страниц с POST-формой: в ETag входит CSRF-кука.
+    on_request(request, **kwargs) вызывается до проверки, то есть и
+    для 304: например, учёт просмотров.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if on_request is not None:
+                on_request(request, **kwargs)
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            _, etag, not_modified = _revalidate(
+                request, get_scopes(**kwargs), csrf=csrf)
+            if not_modified is not None:
+                return not_modified
+            response = view(request, *args, **kwargs)
+            if _cacheable(request, response):
+                _set_etag(response, etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_feed(get_scopes, timeout=None, per_user=True):
+    """Как cache_page, но ключ включает версии областей get_scopes.
+
+    Страница живёт долго, а сигналы сбрасывают её сразу после изменений
+    в нужной ленте. Ключ учитывает пользователя: шапка и кнопки разные.
+    Тот же ключ служит ETag, так что повторный запрос клиента получает 304.
+    per_user=False — одна копия для всех, например для RSS.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_key, etag, not_modified = _revalidate(
+                request, get_scopes(**kwargs), per_user)
+            if not_modified is not None:
+                return not_modified
+            key = 'feed-page:' + page_key
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if not _cacheable(request, response):
+                    return response
+                _set_etag(response, etag, per_user)
+                cache.set(key, response,
+                          timeout or settings.FEED_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
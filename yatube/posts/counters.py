@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import Comment, Counter, Follow, Post
+
+POSTS = 'posts'
+
+
+def group_posts(group_id):
+    return f'group:{group_id}:posts'
+
+
+def author_posts(user_id):
+    return f'author:{user_id}:posts'
+
+
+def author_comments(user_id):
+    return f'author:{user_id}:comments'
+
+
+def author_followers(user_id):
+    return f'author:{user_id}:followers'
+
+
+def author_following(user_id):
+    return f'author:{user_id}:following'
+
+
+def media(name):
+    """Сколько постов ссылается на файл из posts.storage.DedupStorage."""
+    return f'media:{name}'
+
+
+def increment(name, delta=1):
+    """Атомарно меняем счётчик; строку создаём при первом обращении."""
+    with transaction.atomic():
+        if Counter.objects.filter(name=name).update(
+                value=F('value') + delta):
+            return
+        _, created = Counter.objects.get_or_create(
+            name=name, defaults={'value': delta})
+        if not created:
+            Counter.objects.filter(name=name).update(
+                value=F('value') + delta)
+
+
+def advance(names, value):
+    """Поднимаем счётчики хотя бы до value и не меньше чем на 1.
+
+    Для версий: после отката транзакции значение не повторится.
+    """
+    with transaction.atomic():
+        Counter.objects.bulk_create(
+            (Counter(name=name) for name in names), ignore_conflicts=True)
+        Counter.objects.filter(name__in=names).update(
+            value=Greatest(F('value') + 1, value))
+
+
+def store(name, value):
+    """Записываем значение целиком: для отметок фоновых задач."""
+    Counter.objects.update_or_create(name=name, defaults={'value': value})
+
+
+def read(*names):
+    """Значения нескольких счётчиков одним запросом; отсутствующие — 0."""
+    values = dict.fromkeys(names, 0)
+    values.update(
+        Counter.objects.filter(name__in=names).values_list('name', 'value'))
+    return values
+
+
+def value(name):
+    return read(name)[name]
+
+
+def author_stats(user_id):
+    values = read(author_posts(user_id), author_comments(user_id),
+                  author_followers(user_id), author_following(user_id))
+    return {
+        'posts_count': values[author_posts(user_id)],
+        'comments_count': values[author_comments(user_id)],
+        'followers_count': values[author_followers(user_id)],
+        'following_count': values[author_following(user_id)],
+    }
+
+
+def _grouped(queryset, field, name):
+    # order_by(): иначе Meta.ordering попадает в GROUP BY
+    rows = (queryset.exclude(**{field: None}).values(field).order_by()
+            .annotate(total=Count('pk')).values_list(field, 'total'))
+    return {name(key): total for key, total in rows}
+
+
+def recompute():
+    """Считаем все счётчики заново агрегирующими запросами."""
+    values = {POSTS: Post.objects.count()}
+    values.update(_grouped(Post.objects, 'group', group_posts))
+    values.update(_grouped(Post.objects, 'author', author_posts))
+    values.update(_grouped(Comment.objects, 'author', author_comments))
+    values.update(_grouped(Follow.objects, 'author', author_followers))
+    values.update(_grouped(Follow.objects, 'user', author_following))
+    return values
+
+
+def repair():
+    """Перезаписываем счётчики пачкой; возвращаем число строк."""
+    values = recompute()
+    with transaction.atomic():
+        Counter.objects.filter(
+            Q(name=POSTS)
+            | Q(name__startswith='group:')
+            | Q(name__startswith='author:')
+        ).delete()
+        Counter.objects.bulk_create(
+            (Counter(name=name, value=total)
+             for name, total in values.items()),
+        )
+    return len(values)
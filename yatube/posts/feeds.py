@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from . import cache
+from .models import Group, Post, User
+
+# Поля постов для ленты: без моделей, картинок и связанных объектов
+FIELDS = ('pk', 'text', 'pub_date', 'author__username', 'group__title')
+
+
+class PostsFeed(Feed):
+    """RSS последних постов: строки из values(), а не модели."""
+    title = 'Контентище: новые записи'
+    description = 'Последние записи всех авторов'
+
+    def link(self, obj):
+        return reverse('posts:index')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.posts(obj).values(*FIELDS)[:settings.SYNDICATION_SIZE]
+
+    def item_title(self, item):
+        return Truncator(item['text']).chars(50)
+
+    def item_description(self, item):
+        return item['text']
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', kwargs={'post_id': item['pk']})
+
+    def item_pubdate(self, item):
+        return item['pub_date']
+
+    def item_author_name(self, item):
+        return item['author__username']
+
+    def item_categories(self, item):
+        return [item['group__title']] if item['group__title'] else []
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f'Контентище: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:posts_group', kwargs={'slug': obj.slug})
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Контентище: записи {obj.username}'
+
+    def description(self, obj):
+        return f'Последние записи автора {obj.get_full_name() or obj}'
+
+    def link(self, obj):
+        return reverse('posts:profile', kwargs={'username': obj.username})
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+class PostsAtomFeed(PostsFeed):
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+def _index_scopes():
+    return [cache.INDEX]
+
+
+def _group_scopes(slug):
+    return [cache.group_scope(slug)]
+
+
+def _author_scopes(username):
+    return [cache.author_scope(username)]
+
+
+# Ленты одинаковы для всех читателей: кэш общий, а не по пользователю
+index_rss = cache.cache_feed(_index_scopes, per_user=False)(PostsFeed())
+index_atom = cache.cache_feed(_index_scopes, per_user=False)(PostsAtomFeed())
+group_rss = cache.cache_feed(_group_scopes, per_user=False)(GroupFeed())
+group_atom = cache.cache_feed(_group_scopes, per_user=False)(GroupAtomFeed())
+author_rss = cache.cache_feed(_author_scopes, per_user=False)(AuthorFeed())
+author_atom = cache.cache_feed(_author_scopes,
+                               per_user=False)(AuthorAtomFeed())
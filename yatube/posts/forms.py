@@ -1,5 +1,8 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images, minhash
 from .models import Post, Comment
 
 
@@ -18,6 +21,25 @@ class PostForm(forms.ModelForm):
             'image': ('Картинку выберите:'),
         }
 
+    def clean_text(self):
+        text = self.cleaned_data['text']
+        if (settings.POST_DUPLICATES == 'reject'
+                and minhash.find_duplicate(text, exclude=self.instance.pk)):
+            raise forms.ValidationError(
+                'Почти такая же запись уже опубликована')
+        return text
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not image:
+            self.instance.image_width = self.instance.image_height = None
+        elif isinstance(image, UploadedFile):
+            # Новая загрузка: уменьшаем, чистим EXIF и запоминаем размеры
+            image, width, height = images.ingest(image)
+            self.instance.image_width = width
+            self.instance.image_height = height
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,182 @@
+import logging
+import os
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from . import counters, thumbnails
+from .models import Counter
+from .storage import is_content_name, post_images
+
+logger = logging.getLogger(__name__)
+
+# Варианты картинки поста для <picture>: расширение и параметры Pillow
+VARIANTS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 85, 'optimize': True,
+            'progressive': True},
+}
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+}
+
+
+class IngestedFile(TemporaryUploadedFile):
+    """Результат ingest во временном файле.
+
+    FileSystemStorage переносит его на место, не копируя; close()
+    TemporaryUploadedFile переживает уже перенесённый файл.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def _on_disk(upload):
+    """Временный файл с загрузкой: Pillow читает с диска, а не из памяти."""
+    if hasattr(upload, 'temporary_file_path'):
+        return upload
+    spooled = TemporaryUploadedFile(upload.name, upload.content_type,
+                                    upload.size, upload.charset)
+    upload.seek(0)
+    for chunk in upload.chunks():
+        spooled.write(chunk)
+    spooled.flush()
+    return spooled
+
+
+def ingest(upload):
+    """Готовим загруженную картинку к сохранению.
+
+    Уменьшаем до POST_IMAGE_MAX_SIDE по большей стороне, поворачиваем
+    по EXIF и сохраняем без метаданных; из MPO остаётся первый кадр JPEG.
+    Возвращает (файл, ширина, высота); если править нечего, отдаётся
+    исходная загрузка без перекодирования.
+    """
+    source = _on_disk(upload)
+    try:
+        return _downscale(upload, source.temporary_file_path())
+    finally:
+        if source is not upload:
+            source.close()
+
+
+def _downscale(upload, path):
+    limit = settings.POST_IMAGE_MAX_SIDE
+    with Image.open(path) as image:
+        image_format = image.format
+        width, height = image.size
+        has_exif = bool(image.getexif()) or 'exif' in image.info
+        if image_format == 'MPO':
+            # Снимок с превью или стереопарой: оставляем первый кадр JPEG
+            image_format = 'JPEG'
+        elif getattr(image, 'is_animated', False):
+            return _animation(upload, image, has_exif)
+        elif max(width, height) <= limit and not has_exif:
+            upload.seek(0)
+            return upload, width, height
+        # JPEG умеет декодироваться сразу в уменьшенном масштабе
+        image.draft(image.mode, (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        return _save(upload, image, image_format), image.width, image.height
+
+
+def _animation(upload, image, has_exif):
+    """GIF, WebP и APNG не пережимаем: кадры теряться не должны.
+
+    Слишком большие отклоняем, а EXIF убираем, пересохранив все кадры.
+    """
+    limit = settings.POST_IMAGE_MAX_SIDE
+    if max(image.size) > limit:
+        raise ValidationError(
+            f'Анимация больше {limit} px по большей стороне')
+    if not has_exif:
+        upload.seek(0)
+        return upload, image.width, image.height
+    result = _save(upload, image, image.format, save_all=True)
+    return result, image.width, image.height
+
+
+def _save(upload, image, image_format, **options):
+    result = IngestedFile(upload.name, upload.content_type, 0,
+                          upload.charset)
+    # Пустой exif: иначе PNG и WebP перенесут метаданные из image.info
+    options.update(SAVE_OPTIONS.get(image_format, {}), exif=b'')
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    image.save(result, format=image_format, **options)
+    result.size = result.tell()
+    result.seek(0)
+    return result
+
+
+def variant_name(name, ext):
+    """posts/cat.png -> posts/variants/cat.webp"""
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', f'{stem}.{ext}')
+
+
+def make_variant(ext, name):
+    """Пересохраняем оригинал в формате варианта; выполняется в пуле."""
+    options = dict(VARIANTS[ext])
+    target = variant_name(name, ext)
+    # Вариант файла с тем же содержимым уже сделан для другого поста
+    if is_content_name(name) and default_storage.exists(target):
+        return
+    try:
+        with post_images.open(name) as source:
+            with Image.open(source) as image:
+                image.load()
+        if options['format'] == 'WEBP' and image.mode not in ('RGB',
+                                                              'RGBA'):
+            image = image.convert('RGBA')
+        elif options['format'] == 'JPEG' and image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            image = image.convert('RGBA')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        output = BytesIO()
+        image.save(output, **options)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(output.getvalue()))
+    except Exception:
+        logger.exception('Не удалось создать вариант %s для %s', ext, name)
+
+
+_variant_jobs = [partial(make_variant, ext) for ext in VARIANTS]
+
+
+def variants(name):
+    """Имена вариантов картинки по расширениям."""
+    return {ext: variant_name(name, ext) for ext in VARIANTS}
+
+
+def schedule(name):
+    """После сохранения поста: варианты и миниатюры в рабочих потоках."""
+    for job in _variant_jobs:
+        thumbnails.submit(job, name)
+    thumbnails.schedule(name)
+
+
+def discard(name):
+    """Удаляем файл, его варианты и миниатюры, если на него не ссылаются."""
+    if counters.value(counters.media(name)) > 0:
+        return
+    default.kvstore.delete(ImageFile(name, post_images))
+    for variant in variants(name).values():
+        default_storage.delete(variant)
+    post_images.delete(name)
+    Counter.objects.filter(name=counters.media(name)).delete()
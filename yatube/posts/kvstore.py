@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """KV-хранилище sorl с LRU в памяти процесса перед кэшем и БД.
+
+    Запоминаются только найденные записи: отсутствие миниатюры
+    может в любой момент исправить рабочий поток или другой процесс.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _evict(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = super()._get_raw(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._evict(*keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.flush()
+
+    def flush(self):
+        """Очищаем только LRU этого процесса."""
+        with self._lock:
+            self._lru.clear()
+
+    def forget(self, name, storage=None):
+        """Выбрасываем из LRU исходник и все его миниатюры."""
+        if not name:
+            return
+        source = ImageFile(name, storage)
+        thumbnails = self._get(source.key, identity='thumbnails') or []
+        self._evict(
+            add_prefix(source.key),
+            add_prefix(source.key, 'thumbnails'),
+            *(add_prefix(key) for key in thumbnails),
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._lru),
+                'max_size': settings.THUMBNAIL_LRU_SIZE,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
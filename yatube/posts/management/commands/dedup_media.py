@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from sorl.thumbnail import default
+
+from posts import cache, counters, images
+from posts.models import Counter, Post
+from posts.storage import is_content_name, post_images
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище с именами по sha256, '
+            'пересчитывает ссылки и удаляет файлы, на которые никто '
+            'не ссылается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет сделано')
+        parser.add_argument('--grace', type=int, default=60,
+                            help='Не трогать файлы моложе стольких минут: '
+                                 'пост для них может ещё сохраняться')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = self.migrate(dry_run)
+        if not dry_run:
+            self.recount()
+        removed = self.collect(dry_run, timedelta(minutes=options['grace']))
+        if not dry_run:
+            default.kvstore.cleanup()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, удалено сирот: {removed}'))
+
+    def migrate(self, dry_run):
+        """Старые имена -> имена по содержимому, одинаковые файлы — в один."""
+        names = (Post.objects.exclude(image='')
+                 .values_list('image', flat=True).distinct())
+        moved = 0
+        for name in list(names):
+            if is_content_name(name) or not post_images.exists(name):
+                continue
+            moved += 1
+            if dry_run:
+                self.stdout.write(f'{name} -> по содержимому')
+                continue
+            with post_images.open(name) as source:
+                new_name = post_images.save(name, source)
+            posts = Post.objects.filter(image=name)
+            scopes = {cache.INDEX}
+            for pk, username, slug in posts.values_list(
+                    'pk', 'author__username', 'group__slug'):
+                scopes.add(cache.post_scope(pk))
+                scopes.add(cache.author_scope(username))
+                if slug:
+                    scopes.add(cache.group_scope(slug))
+            posts.update(image=new_name)
+            cache.bump(*scopes)
+            default.kvstore.forget(name, post_images)
+            for variant in images.variants(name).values():
+                default_storage.delete(variant)
+            post_images.delete(name)
+            images.schedule(new_name)
+        return moved
+
+    def recount(self):
+        prefix = counters.media('')
+        rows = (Post.objects.exclude(image='').values('image').order_by()
+                .annotate(total=Count('pk')).values_list('image', 'total'))
+        with transaction.atomic():
+            Counter.objects.filter(name__startswith=prefix).delete()
+            Counter.objects.bulk_create(
+                Counter(name=counters.media(name), value=total)
+                for name, total in rows if is_content_name(name))
+
+    def collect(self, dry_run, grace):
+        started = timezone.now()
+        referenced = set(Post.objects.exclude(image='')
+                         .values_list('image', flat=True))
+        removed = 0
+        folder = Post._meta.get_field('image').upload_to.rstrip('/')
+        if not post_images.exists(folder):
+            return removed
+        for name in list(post_images.walk(folder)):
+            if (name in referenced
+                    or post_images.get_modified_time(name) > started - grace):
+                continue
+            removed += 1
+            if dry_run:
+                self.stdout.write(f'{name} — сирота')
+            else:
+                images.discard(name)
+        return removed
@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.bench import measure, summary, temporary_database
+from posts.models import Comment, Follow, Group, Post, Timeline
+from posts.seeding import seed_feeds
+from yatube.settings import QUANTITY
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Заполняет временную БД и печатает EXPLAIN QUERY PLAN '
+            'и время запросов лент')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            self.stdout.write(f"Заполняем {options['posts']} постов...")
+            seed_feeds(options['users'], options['groups'],
+                       options['posts'], options['follows'])
+            for name, queryset in self.queries():
+                self.report(name, queryset, options['repeat'])
+
+    def queries(self):
+        post = Post.objects.order_by('?').first()
+        follow = Follow.objects.first()
+        group = Group.objects.first()
+        return (
+            ('index', Post.objects.all()),
+            ('posts_group', Post.objects.filter(group=group)),
+            ('profile', Post.objects.filter(author_id=post.author_id)),
+            ('follow_index', Post.objects.filter(
+                timeline_entries__user_id=follow.user_id
+            ).order_by('-timeline_entries__pub_date')),
+            ('timeline', Timeline.objects.filter(user_id=follow.user_id)),
+            ('post_detail comments', Comment.objects.filter(post=post)),
+            ('profile_follow', Follow.objects.filter(
+                user_id=follow.user_id, author_id=follow.author_id)),
+        )
+
+    def report(self, name, queryset, repeat):
+        page = queryset[:QUANTITY]
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(page.explain())
+        timings = summary(measure(lambda: list(page.all()), repeat))
+        self.stdout.write(f'  {timings}\n')
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import minhash
+from posts.models import Post, PostFingerprint
+
+
+class Command(BaseCommand):
+    help = ('Считает MinHash-подписи старых постов пачками и помечает '
+            'почти дубли более ранних записей')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать и уже проиндексированные')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk')
+        if not options['all']:
+            posts = posts.filter(fingerprint__isnull=True)
+        last = 0
+        indexed = flagged = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last).values_list(
+                'pk', 'text')[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1][0]
+            done, found = self.index(batch)
+            indexed += done
+            flagged += found
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписей: {indexed}, почти дублей: {flagged}'))
+
+    def index(self, batch):
+        rows = []
+        for pk, text in batch:
+            signature = minhash.signature(text)
+            if signature is not None:
+                rows.append((pk, signature))
+        with transaction.atomic():
+            minhash.store(rows)
+            # Пачка уже в индексе: дубли ищем и внутри неё
+            flagged = []
+            for pk, signature in rows:
+                found = minhash.nearest(signature, before=pk)
+                if found:
+                    flagged.append(PostFingerprint(
+                        post_id=pk, duplicate_of_id=found[0]))
+            PostFingerprint.objects.bulk_update(
+                flagged, ['duplicate_of'], batch_size=500)
+        return len(rows), len(flagged)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт WebP и JPEG варианты картинок уже опубликованных постов'
+
+    def handle(self, *args, **options):
+        names = (Post.objects.exclude(image='')
+                 .values_list('image', flat=True).distinct())
+        total = 0
+        for name in names.iterator():
+            for ext in images.VARIANTS:
+                images.make_variant(ext, name)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {total}'))
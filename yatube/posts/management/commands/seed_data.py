@@ -0,0 +1,58 @@
+from argparse import ArgumentTypeError
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts.seeding import SEED_UNTIL, SkewedSeeder
+
+
+def moment(value):
+    """Дата или дата и время из --until в ISO 8601; без пояса — UTC."""
+    parsed = parse_datetime(value)
+    if parsed is None and parse_date(value) is not None:
+        parsed = datetime.combine(parse_date(value), time())
+    if parsed is None:
+        raise ArgumentTypeError(f'Не удалось разобрать дату: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = ('Быстро заполняет базу пользователями, постами, комментариями '
+            'и подписками пачками bulk_create; повторный запуск продолжает '
+            'прерванный')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--comments', type=int, default=3_000_000)
+        parser.add_argument('--follows-mean', type=float, default=30,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--alpha', type=float, default=1.2,
+                            help='Показатель степенного закона популярности')
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--until', type=moment, default=SEED_UNTIL,
+                            help='Дата последнего поста, ISO 8601; '
+                                 'даты зависят от неё и seed, а не от now()')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--restart', action='store_true',
+                            help='Забыть отметки прошлого запуска')
+
+    def handle(self, *args, **options):
+        seeder = SkewedSeeder(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows_mean'],
+            seed=options['seed'], alpha=options['alpha'],
+            days=options['days'], batch_size=options['batch_size'],
+            until=options['until'],
+            log=self.stdout.write,
+        )
+        if options['restart']:
+            seeder.reset()
+        seeder.run()
+        self.stdout.write(self.style.SUCCESS('Готово'))
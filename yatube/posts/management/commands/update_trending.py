@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Обновляет рейтинг популярных постов по комментариям, '
+            'появившимся с прошлого запуска; запускается по расписанию')
+
+    def handle(self, *args, **options):
+        processed = trending.update()
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтено новых комментариев: {processed}'))
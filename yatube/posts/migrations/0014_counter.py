@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Counter = apps.get_model('posts', 'Counter')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    values = {'posts': Post.objects.count()}
+    sources = (
+        (Post, 'group', 'group:{}:posts'),
+        (Post, 'author', 'author:{}:posts'),
+        (Comment, 'author', 'author:{}:comments'),
+        (Follow, 'author', 'author:{}:followers'),
+        (Follow, 'user', 'author:{}:following'),
+    )
+    for model, field, name in sources:
+        rows = (model.objects.exclude(**{field: None}).values(field)
+                .order_by().annotate(total=Count('pk')).values_list(field, 'total'))
+        values.update((name.format(key), total) for key, total in rows)
+    Counter.objects.bulk_create(
+        [Counter(name=name, value=total) for name, total in values.items()],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
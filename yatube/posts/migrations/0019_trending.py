@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trending',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post')),
+                ('score', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-score', '-post_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trending',
+            index=models.Index(fields=['-score', '-post'], name='posts_trend_score_36995a_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Пост'), ('group', 'Группа'), ('author', 'Автор')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('day', models.DateField()),
+                ('sketch', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['-day'],
+                'unique_together': {('kind', 'object_id', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,130 @@
+import hashlib
+import random
+import re
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import FingerprintBucket, PostFingerprint
+
+# 64 хэш-функции: 16 полос по 4 значения. Пост с похожестью 0.7 делит
+# с оригиналом хотя бы одну корзину с вероятностью 1 - (1 - 0.7 ** 4) ** 16
+# ≈ 0.996, а посты с парой общих слов — почти никогда
+HASHES = 64
+ROWS = 4
+BANDS = HASHES // ROWS
+# Универсальное хэширование (a * x + b) mod простое Мерсенна
+PRIME = (1 << 61) - 1
+_rng = random.Random(0)
+COEFFICIENTS = [(_rng.randrange(1, PRIME), _rng.randrange(PRIME))
+                for _ in range(HASHES)]
+WORD = re.compile(r'\w+')
+# Сколько кандидатов из корзин проверяем по подписи
+MAX_CANDIDATES = 100
+
+
+def features(text):
+    """Слова и пары соседних слов: пары учитывают порядок."""
+    words = WORD.findall(text.lower())
+    return set(words) | {f'{first} {second}'
+                         for first, second in zip(words, words[1:])}
+
+
+def _hash(value, size=8):
+    digest = hashlib.blake2b(value.encode(), digest_size=size).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def signature(text):
+    """MinHash-подпись; None, если слов слишком мало для сравнения."""
+    if len(WORD.findall(text)) < settings.DUPLICATE_MIN_WORDS:
+        return None
+    hashed = [_hash(feature) % PRIME for feature in features(text)]
+    return [min((a * value + b) % PRIME for value in hashed)
+            for a, b in COEFFICIENTS]
+
+
+def similarity(first, second):
+    """Оценка доли общих признаков двух текстов по подписям."""
+    return sum(x == y for x, y in zip(first, second)) / HASHES
+
+
+def buckets(signature):
+    # 7 байт: значение всегда помещается в знаковый BigIntegerField
+    return [_hash(f'{band}:{signature[band * ROWS:(band + 1) * ROWS]}', 7)
+            for band in range(BANDS)]
+
+
+def pack(signature):
+    return array('Q', signature).tobytes()
+
+
+def unpack(data):
+    return array('Q', bytes(data)).tolist()
+
+
+def nearest(signature, exclude=None, before=None):
+    """Самый похожий пост: (post_id, похожесть) или None.
+
+    Кандидаты — посты с общими корзинами, больше общих — раньше;
+    подписи сравниваем только у них, а не по всей таблице.
+    """
+    candidates = FingerprintBucket.objects.filter(
+        bucket__in=buckets(signature))
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    if before is not None:
+        candidates = candidates.filter(post_id__lt=before)
+    ids = (candidates.values('post_id').order_by()
+           .annotate(shared=Count('pk')).order_by('-shared')
+           .values_list('post_id', flat=True)[:MAX_CANDIDATES])
+    best = None
+    for post_id, data in PostFingerprint.objects.filter(
+            post_id__in=list(ids)).values_list('post_id', 'signature'):
+        score = similarity(signature, unpack(data))
+        if score >= settings.DUPLICATE_SIMILARITY and (
+                best is None or score > best[1]):
+            best = post_id, score
+    return best
+
+
+def find_duplicate(text, exclude=None):
+    """Пост, почти совпадающий с text; None, если такого нет."""
+    found = None
+    current = signature(text)
+    if current is not None:
+        found = nearest(current, exclude=exclude)
+    return found[0] if found else None
+
+
+def store(rows):
+    """Пишем подписи [(post_id, signature)] и их корзины пачкой."""
+    post_ids = [post_id for post_id, _ in rows]
+    with transaction.atomic():
+        PostFingerprint.objects.filter(post_id__in=post_ids).delete()
+        FingerprintBucket.objects.filter(post_id__in=post_ids).delete()
+        PostFingerprint.objects.bulk_create(
+            (PostFingerprint(post_id=post_id, signature=pack(current))
+             for post_id, current in rows), batch_size=500)
+        FingerprintBucket.objects.bulk_create(
+            (FingerprintBucket(post_id=post_id, bucket=bucket)
+             for post_id, current in rows for bucket in buckets(current)),
+            batch_size=500)
+
+
+def index_post(post_id, text):
+    """Пишем подпись поста; возвращаем id более раннего дубля."""
+    current = signature(text)
+    if current is None:
+        PostFingerprint.objects.filter(post_id=post_id).delete()
+        FingerprintBucket.objects.filter(post_id=post_id).delete()
+        return None
+    found = nearest(current, before=post_id)
+    store([(post_id, current)])
+    duplicate_of = found[0] if found else None
+    if duplicate_of:
+        PostFingerprint.objects.filter(post_id=post_id).update(
+            duplicate_of=duplicate_of)
+    return duplicate_of
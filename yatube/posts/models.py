@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, LPad
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from .storage import post_images
+
 User = get_user_model()
 
 
@@ -33,20 +38,56 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_images,
         blank=True
     )
+    # Размеры оригинала записывает posts.images.ingest: шаблонам
+    # не нужно открывать файл. width_field не подходит — Django
+    # читает файл при каждой загрузке поста без размеров.
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False)
+    # Пишется пачками из posts.buffers, а не на каждый просмотр
+    views = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты фильтруют по автору или группе и сортируют по дате;
+        # id в конце — ключ курсора, без него SQLite досортировывает
+        # строки с одинаковой датой
+        indexes = [
+            models.Index(fields=['-pub_date', '-id']),
+            models.Index(fields=['author', '-pub_date', '-id']),
+            models.Index(fields=['group', '-pub_date', '-id']),
+        ]
 
     def get_absolute_url(self):
         return reverse('post', kwargs={'slug': self.slug})
 
+    def save(self, *args, **kwargs):
+        # Правка поста не должна затирать просмотры, записанные
+        # буфером после того, как пост был прочитан
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'views']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.text[:15]
 
 
 class Comment(models.Model):
+    """Комментарий; ответы хранятся деревом с материализованным путём.
+
+    path — id всех предков и самого комментария, каждый дополнен нулями
+    до PATH_STEP знаков. Сортировка по (post, path) даёт всё дерево
+    поста в порядке обхода в глубину одним диапазоном по индексу,
+    а поддерево — это пути между path и path + '~'.
+    """
+    PATH_STEP = 10
+
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
     author = models.ForeignKey(
@@ -60,13 +101,53 @@ class Comment(models.Model):
         null=True,
         related_name='comments',
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='replies',
+    )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created']),
+            models.Index(fields=['post', 'path']),
+        ]
 
     def __str__(self):
         return self.text
 
+    @classmethod
+    def segment(cls, pk):
+        return str(pk).zfill(cls.PATH_STEP)
+
+    @classmethod
+    def root_path(cls):
+        """Выражение пути корня: для bulk_create, где id узнаём после."""
+        return LPad(Cast('pk', CharField()), cls.PATH_STEP, Value('0'))
+
+    @property
+    def subtree_end(self):
+        # Цифры меньше '~': все пути потомков лежат в (path, path + '~')
+        return self.path + '~'
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding and not self.path
+        if creating and self.parent_id:
+            # Глубже предела не уходим: ответ становится соседним
+            if self.parent.depth >= settings.COMMENTS_MAX_DEPTH:
+                self.parent = self.parent.parent
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if creating:
+            prefix = self.parent.path if self.parent_id else ''
+            self.path = prefix + self.segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -80,5 +161,146 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
     def __str__(self):
         return f"{self.user} follows {self.author}"
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост).
+
+    Заполняется при публикации поста и при подписке, поэтому чтение
+    /follow/ — это диапазон по индексу (user, -pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Копия Post.pub_date, чтобы сортировка не требовала join
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} <- {self.post_id}"
+
+
+class Counter(models.Model):
+    """Поддерживаемый сигналами счётчик вместо COUNT(*) на каждый запрос.
+
+    Имена: 'posts', 'group:<id>:posts', 'author:<id>:posts' и т.п.,
+    см. posts.counters.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class Trending(models.Model):
+    """Рейтинг популярных постов, который ведёт posts.trending.
+
+    Очки растут от новых комментариев (с весом по охвату автора)
+    и экспоненциально затухают; хранится только верх рейтинга.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending'
+    )
+    score = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['-score', '-post_id']
+        indexes = [
+            models.Index(fields=['-score', '-post']),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}: {self.score:.2f}"
+
+
+class VisitorSketch(models.Model):
+    """Скетч HyperLogLog уникальных читателей сущности за день.
+
+    Читатели поста, его группы и автора; сами пары (читатель, пост)
+    не хранятся. Скетчи за разные дни объединяются, см. posts.hll.
+    """
+    POST = 'post'
+    GROUP = 'group'
+    AUTHOR = 'author'
+    KINDS = (
+        (POST, 'Пост'),
+        (GROUP, 'Группа'),
+        (AUTHOR, 'Автор'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    day = models.DateField()
+    sketch = models.BinaryField()
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = ('kind', 'object_id', 'day')
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id} {self.day}"
+
+
+class PostFingerprint(models.Model):
+    """MinHash-подпись текста поста для поиска почти дублей.
+
+    Подпись разбита на полосы, каждая полоса — корзина в
+    FingerprintBucket: похожие посты ищутся по общим корзинам,
+    см. posts.minhash. Отдельные таблицы, чтобы не трогать posts_post.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fingerprint'
+    )
+    signature = models.BinaryField()
+    # Более ранний почти такой же пост, если нашёлся
+    duplicate_of = models.ForeignKey(
+        Post,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates'
+    )
+
+    def __str__(self):
+        return f"{self.post_id} -> {self.duplicate_of_id}"
+
+
+class FingerprintBucket(models.Model):
+    """Корзина LSH: хэш одной полосы подписи вместе с её номером."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='fingerprint_buckets'
+    )
+    bucket = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"{self.post_id}: {self.bucket:x}"
@@ -0,0 +1,221 @@
+import base64
+import binascii
+import heapq
+from collections.abc import Sequence
+from datetime import datetime
+from itertools import islice
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def pack_cursor(value, pk, serialize=str):
+    """Упаковываем пару (значение, id) в непрозрачный токен для URL."""
+    raw = f'{serialize(value)}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def unpack_cursor(token, parse=str):
+    """Распаковываем токен; на мусор возвращаем None, а не ошибку.
+
+    parse превращает строку обратно в значение; ValueError или None
+    от него тоже означают мусор.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = raw.decode().rsplit('|', 1)
+        value = parse(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def encode_cursor(value, pk):
+    """Курсор по паре (дата, id)."""
+    return pack_cursor(value, pk, datetime.isoformat)
+
+
+def decode_cursor(token):
+    """Обратно к паре (дата, id) или None."""
+    return unpack_cursor(token, parse_datetime)
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным числом записей (из posts.counters)."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @property
+    def count(self):
+        return self._count
+
+
+class CursorPage(Sequence):
+    """Страница без номера и без общего количества записей.
+
+    Повторяет ту часть интерфейса Page, которой пользуются шаблоны.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage after={self.next_cursor}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по паре (field, id).
+
+    Вместо COUNT(*) и OFFSET запрос продолжается с последней показанной
+    записи, поэтому любая страница стоит как первая.
+    """
+
+    def __init__(self, queryset, per_page, field='pub_date', descending=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+
+    def _ordering(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return (f'{prefix}{self.field}', f'{prefix}pk'), descending
+
+    def _seek(self, cursor, descending):
+        # Не «field < v OR (field = v AND pk < id)»: по OR SQLite строит
+        # MULTI-INDEX OR и сортирует весь хвост во временном B-дереве.
+        # Диапазон по field с исключением уже показанных при field = v
+        # идёт по индексу в нужном порядке и останавливается на LIMIT
+        value, pk = cursor
+        lookup, seen = ('lte', 'gte') if descending else ('gte', 'lte')
+        return (Q(**{f'{self.field}__{lookup}': value})
+                & ~Q(**{self.field: value, f'pk__{seen}': pk}))
+
+    def _encode(self, value, pk):
+        return encode_cursor(value, pk)
+
+    def _decode(self, token):
+        return decode_cursor(token)
+
+    def _cursor(self, obj):
+        return self._encode(getattr(obj, self.field), obj.pk)
+
+    def ordered(self, cursor=None, backwards=False):
+        """Queryset, отсортированный и продолженный с позиции cursor."""
+        ordering, descending = self._ordering(reverse=backwards)
+        queryset = self.queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek(cursor, descending))
+        return queryset
+
+    def _fetch(self, cursor, backwards):
+        return list(self.ordered(cursor, backwards)[:self.per_page + 1])
+
+    def get_page(self, after=None, before=None):
+        before = self._decode(before)
+        after = None if before else self._decode(after)
+        backwards = before is not None
+        cursor = before or after
+        object_list = self._fetch(cursor, backwards)
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if backwards:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+        if not object_list:
+            return CursorPage(object_list)
+        return CursorPage(
+            object_list,
+            next_cursor=self._cursor(object_list[-1]) if has_next else None,
+            previous_cursor=(self._cursor(object_list[0])
+                             if has_previous else None),
+        )
+
+
+class ValuesCursorPaginator(CursorPaginator):
+    """Keyset-пагинация строк values(): ключ курсора берётся из dict.
+
+    В values() должны быть field и pk.
+    """
+
+    def _cursor(self, row):
+        return self._encode(row[self.field], row['pk'])
+
+
+class TextCursorPaginator(CursorPaginator):
+    """Keyset-пагинация по текстовому полю, например Comment.path."""
+
+    def _encode(self, value, pk):
+        return pack_cursor(value, pk)
+
+    def _decode(self, token):
+        return unpack_cursor(token)
+
+
+class MergePaginator(CursorPaginator):
+    """Ленивое k-путевое слияние уже отсортированных лент через heapq.
+
+    heapq.merge сразу читает голову каждого источника, поэтому первая
+    порция — одна строка, а порции растут вдвое (до размера страницы),
+    только пока источник попадает на страницу. На k источников это k
+    коротких запросов по индексу плюс несколько на активные ленты;
+    в памяти — строка на источник и порядка двух страниц, а не все
+    посты авторов.
+    """
+
+    def __init__(self, querysets, per_page, field='pub_date', descending=True):
+        super().__init__(None, per_page, field, descending)
+        self.querysets = querysets
+
+    def _stream(self, queryset, cursor, ordering, descending):
+        queryset = queryset.order_by(*ordering)
+        chunk_size = 1
+        while True:
+            chunk = queryset
+            if cursor is not None:
+                chunk = chunk.filter(self._seek(cursor, descending))
+            chunk = list(chunk[:chunk_size])
+            yield from chunk
+            if len(chunk) < chunk_size:
+                return
+            cursor = getattr(chunk[-1], self.field), chunk[-1].pk
+            chunk_size = min(chunk_size * 2, self.per_page + 1)
+
+    def _fetch(self, cursor, backwards):
+        ordering, descending = self._ordering(reverse=backwards)
+        streams = [self._stream(queryset, cursor, ordering, descending)
+                   for queryset in self.querysets]
+        merged = heapq.merge(
+            *streams,
+            key=lambda obj: (getattr(obj, self.field), obj.pk),
+            reverse=descending,
+        )
+        return list(islice(merged, self.per_page + 1))
@@ -0,0 +1,156 @@
+import re
+
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .paginators import pack_cursor, unpack_cursor
+
+# Внешний FTS5-индекс по posts_post.text: сам текст в индексе не хранится,
+# а триггеры поддерживают индекс при любых INSERT/UPDATE/DELETE,
+# в том числе bulk_create и update() в обход сигналов
+TABLE = 'posts_post_fts'
+TRIGGERS = {
+    'posts_post_fts_insert': (
+        f'AFTER INSERT ON posts_post BEGIN '
+        f'INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END'
+    ),
+    'posts_post_fts_delete': (
+        f'AFTER DELETE ON posts_post BEGIN '
+        f"INSERT INTO {TABLE}({TABLE}, rowid, text) "
+        f"VALUES ('delete', old.id, old.text); END"
+    ),
+    'posts_post_fts_update': (
+        f'AFTER UPDATE OF text ON posts_post BEGIN '
+        f"INSERT INTO {TABLE}({TABLE}, rowid, text) "
+        f"VALUES ('delete', old.id, old.text); "
+        f'INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END'
+    ),
+}
+# Маркеры совпадений в snippet(): HTML экранируем уже после FTS5
+MARK_START, MARK_END = '\x02', '\x03'
+WORD = re.compile(r'\w+')
+
+
+def install(cursor):
+    """Создаём индекс и триггеры; возвращает True, если чего-то не было."""
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+        f"text, content='posts_post', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')")
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        f"AND name IN ({', '.join(['%s'] * len(TRIGGERS))})",
+        list(TRIGGERS))
+    existing = {name for name, in cursor.fetchall()}
+    for name, body in TRIGGERS.items():
+        if name not in existing:
+            cursor.execute(f'CREATE TRIGGER {name} {body}')
+    return existing != set(TRIGGERS)
+
+
+def rebuild(cursor):
+    cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(cursor):
+    for name in TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def ensure_index(sender, using='default', **kwargs):
+    """post_migrate: возвращаем триггеры и перестраиваем индекс.
+
+    SQLite-миграции пересоздают posts_post при многих ALTER TABLE,
+    и триггеры старой таблицы пропадают вместе с ней.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        if install(cursor):
+            rebuild(cursor)
+
+
+def match_query(text):
+    """Пользовательский ввод -> запрос FTS5: все слова, последнее — префикс.
+
+    Операторы FTS5 во вводе не работают: каждое слово берётся в кавычки.
+    """
+    words = WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(rank, pk):
+    return pack_cursor(rank, pk, repr)
+
+
+def decode_cursor(token):
+    return unpack_cursor(token, float)
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>')
+                     .replace(MARK_END, '</mark>'))
+
+
+def search(text, per_page, after=None, group_id=None, author_id=None):
+    """Страница результатов: [(pk, rank, snippet)], курсор следующей.
+
+    Порядок — по bm25 (чем меньше, тем лучше), затем по id; курсор
+    продолжает с последней пары, как и keyset-пагинация лент.
+    """
+    query = match_query(text)
+    if query is None:
+        return [], None
+    where, params = [f'{TABLE} MATCH %s'], [query]
+    if group_id is not None:
+        where.append('p.group_id = %s')
+        params.append(group_id)
+    if author_id is not None:
+        where.append('p.author_id = %s')
+        params.append(author_id)
+    sql = (
+        f'SELECT p.id, bm25({TABLE}) AS rank, '
+        f"snippet({TABLE}, 0, %s, %s, '…', 16) AS snippet "
+        f'FROM {TABLE} JOIN posts_post p ON p.id = {TABLE}.rowid '
+        f"WHERE {' AND '.join(where)}"
+    )
+    params = [MARK_START, MARK_END, *params]
+    seek = ''
+    cursor_value = decode_cursor(after)
+    if cursor_value is not None:
+        seek = 'WHERE rank > %s OR (rank = %s AND id > %s)'
+        params += [cursor_value[0], cursor_value[0], cursor_value[1]]
+    sql = (f'SELECT id, rank, snippet FROM ({sql}) {seek} '
+           f'ORDER BY rank, id LIMIT %s')
+    params.append(per_page + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    results = [(pk, rank, highlight(snippet)) for pk, rank, snippet in rows]
+    return results, next_cursor
+
+
+def filter_posts(queryset, text):
+    """Оставляет в queryset постов только подходящие под запрос.
+
+    RawSQL в pk__in Django берёт в двойные скобки, и SQLite считает
+    подзапрос скалярным — поэтому условие добавляем через extra().
+    """
+    query = match_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.extra(
+        where=[f'posts_post.id IN (SELECT rowid FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s)'],
+        params=[query])
@@ -0,0 +1,244 @@
+import io
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import counters
+from .models import Comment, Counter, Follow, Group, Post, Timeline
+
+User = get_user_model()
+IMAGE_SIZE = (1200, 800)
+# Даты SkewedSeeder отсчитываются назад от этой точки, а не от now():
+# иначе повторный или продолженный запуск сдвигает все даты
+SEED_UNTIL = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@contextmanager
+def manual_dates():
+    """Даём bulk_create записать свои pub_date/created вместо now()."""
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def fill_timelines():
+    """Строим Timeline одним INSERT ... SELECT: bulk_create без сигналов."""
+    timeline = Timeline._meta.db_table
+    follow = Follow._meta.db_table
+    post = Post._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {timeline}')
+        cursor.execute(
+            f'INSERT INTO {timeline} (user_id, post_id, pub_date) '
+            f'SELECT f.user_id, p.id, p.pub_date FROM {follow} f '
+            f'JOIN {post} p ON p.author_id = f.author_id'
+        )
+
+
+def make_image(rng, size=IMAGE_SIZE):
+    """Однотонная JPEG-картинка со случайным цветом."""
+    color = tuple(rng.randrange(256) for _ in range(3))
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return ContentFile(buffer.getvalue())
+
+
+def seed_feeds(users, groups, posts, follows=0, comments=0, images=0,
+               seed=0, chunk_size=5000):
+    """Простой равномерный набор данных для замеров."""
+    rng = random.Random(seed)
+    User.objects.bulk_create(
+        (User(username=f'bench_{i}') for i in range(users)))
+    Group.objects.bulk_create(
+        (Group(title=f'Группа {i}', slug=f'bench-{i}', description='')
+         for i in range(groups)))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True)) + [None]
+    now = timezone.now()
+    with manual_dates():
+        for start in range(0, posts, chunk_size):
+            Post.objects.bulk_create(
+                Post(text=f'Пост {i}',
+                     author_id=rng.choice(user_ids),
+                     group_id=rng.choice(group_ids),
+                     pub_date=now - timedelta(seconds=posts - i))
+                for i in range(start, min(start + chunk_size, posts)))
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        for start in range(0, comments, chunk_size):
+            Comment.objects.bulk_create(
+                Comment(text=f'Комментарий {i}',
+                        author_id=rng.choice(user_ids),
+                        post_id=rng.choice(post_ids),
+                        created=now - timedelta(seconds=comments - i))
+                for i in range(start, min(start + chunk_size, comments)))
+    Comment.objects.filter(path='').update(path=Comment.root_path())
+    if images and post_ids:
+        # Несколько разных файлов на все посты с картинками
+        names = [default_storage.save(f'posts/bench_{i}.jpg', make_image(rng))
+                 for i in range(min(images, 20))]
+        for i, pk in enumerate(rng.sample(post_ids, min(images, posts))):
+            Post.objects.filter(pk=pk).update(
+                image=names[i % len(names)], image_width=IMAGE_SIZE[0],
+                image_height=IMAGE_SIZE[1])
+    pairs = set()
+    while len(pairs) < min(follows, len(user_ids) * (len(user_ids) - 1)):
+        user, author = rng.sample(user_ids, 2)
+        pairs.add((user, author))
+    Follow.objects.bulk_create(
+        (Follow(user_id=user, author_id=author) for user, author in pairs))
+    fill_timelines()
+    counters.repair()
+
+
+def power_law(size, alpha):
+    """Накопленные веса Ципфа: первые элементы намного популярнее."""
+    return list(accumulate(1 / (rank + 1) ** alpha for rank in range(size)))
+
+
+class SkewedSeeder:
+    """Большой реалистичный набор данных для стендов.
+
+    Подписчики и активность авторов распределены по степенному закону,
+    посты идут всплесками. Каждая пачка строится из собственного
+    Random(seed, этап, номер пачки) и коммитится вместе с отметкой
+    в Counter, поэтому прерванный запуск продолжается с той же пачки
+    и даёт тот же результат.
+    """
+    stages = ('users', 'groups', 'posts', 'comments', 'follows')
+
+    def __init__(self, users, groups, posts, comments, follows_mean,
+                 seed=0, alpha=1.2, days=365, batch_size=10_000,
+                 until=SEED_UNTIL, log=print):
+        self.sizes = {'users': users, 'groups': groups, 'posts': posts,
+                      'comments': comments, 'follows': users}
+        self.follows_mean = follows_mean
+        self.seed = seed
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.log = log
+        self.finished = until
+        self.span = timedelta(days=days).total_seconds()
+
+    def rng(self, stage, batch):
+        return random.Random(f'{self.seed}:{stage}:{batch}')
+
+    def checkpoint(self, stage):
+        return f'seed:{self.seed}:{stage}'
+
+    def run(self):
+        for stage in self.stages:
+            self.run_stage(stage)
+        self.log('Строим ленты и счётчики...')
+        fill_timelines()
+        counters.repair()
+
+    def run_stage(self, stage):
+        batches = -(-self.sizes[stage] // self.batch_size)
+        done = counters.value(self.checkpoint(stage))
+        if done < batches:
+            self.prepare(stage)
+        for batch in range(done, batches):
+            start = batch * self.batch_size
+            stop = min(start + self.batch_size, self.sizes[stage])
+            with transaction.atomic(), manual_dates():
+                getattr(self, f'make_{stage}')(
+                    self.rng(stage, batch), range(start, stop))
+                counters.increment(self.checkpoint(stage))
+            self.log(f'{stage}: {batch + 1}/{batches}')
+
+    def prepare(self, stage):
+        if stage in ('posts', 'comments', 'follows'):
+            self.user_ids = list(
+                User.objects.filter(username__startswith=f'seed{self.seed}_')
+                .order_by('pk').values_list('pk', flat=True))
+            self.popularity = power_law(len(self.user_ids), self.alpha)
+            # Самые читаемые авторы не обязаны быть самыми пишущими
+            self.writers = self.user_ids[:]
+            random.Random(f'{self.seed}:writers').shuffle(self.writers)
+        if stage == 'posts':
+            self.group_ids = list(
+                Group.objects.filter(slug__startswith=f'seed{self.seed}-')
+                .values_list('pk', flat=True)) + [None]
+        if stage == 'comments':
+            self.post_ids = list(
+                Post.objects.filter(
+                    author__username__startswith=f'seed{self.seed}_')
+                .order_by('pk').values_list('pk', flat=True))
+
+    def make_users(self, rng, indexes):
+        User.objects.bulk_create(
+            (User(username=f'seed{self.seed}_{i}', password='!')
+             for i in indexes),
+            ignore_conflicts=True)
+
+    def make_groups(self, rng, indexes):
+        Group.objects.bulk_create(
+            (Group(title=f'Сообщество {i}', slug=f'seed{self.seed}-{i}',
+                   description=f'Описание сообщества {i}')
+             for i in indexes),
+            ignore_conflicts=True)
+
+    def make_posts(self, rng, indexes):
+        posts = []
+        while len(posts) < len(indexes):
+            # Всплеск: один автор пишет несколько постов подряд
+            author = rng.choices(self.writers, cum_weights=self.popularity)[0]
+            group = rng.choice(self.group_ids)
+            moment = rng.uniform(0, self.span)
+            for _ in range(min(int(rng.expovariate(1 / 4)) + 1,
+                               len(indexes) - len(posts))):
+                moment = min(self.span, moment + rng.expovariate(1 / 120))
+                posts.append(Post(
+                    text=f'Пост {indexes[len(posts)]} автора {author}',
+                    author_id=author, group_id=group,
+                    pub_date=self.finished - timedelta(
+                        seconds=self.span - moment)))
+        Post.objects.bulk_create(posts)
+
+    def make_comments(self, rng, indexes):
+        last = (Comment.objects.order_by('-pk')
+                .values_list('pk', flat=True).first() or 0)
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}',
+                    author_id=rng.choices(self.user_ids,
+                                          cum_weights=self.popularity)[0],
+                    post_id=rng.choice(self.post_ids),
+                    created=self.finished - timedelta(
+                        seconds=rng.uniform(0, self.span)))
+            for i in indexes)
+        # bulk_create не вызывает save(): пути корням ставим одним UPDATE
+        # по диапазону pk этой пачки, не просматривая всю таблицу
+        Comment.objects.filter(pk__gt=last, path='').update(
+            path=Comment.root_path())
+
+    def make_follows(self, rng, indexes):
+        follows = []
+        for i in indexes:
+            user = self.user_ids[i]
+            wanted = min(int(rng.expovariate(1 / self.follows_mean)),
+                         len(self.user_ids) - 1)
+            authors = set(rng.choices(self.user_ids,
+                                      cum_weights=self.popularity, k=wanted))
+            authors.discard(user)
+            follows.extend(Follow(user_id=user, author_id=author)
+                           for author in authors)
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    def reset(self):
+        """Забываем отметки, чтобы следующий запуск начал с нуля."""
+        Counter.objects.filter(
+            name__startswith=f'seed:{self.seed}:').delete()
@@ -0,0 +1,193 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from sorl.thumbnail import default
+
+from . import cache, counters, images, minhash
+from .models import Comment, Follow, Group, Post, Timeline
+from .storage import is_content_name, post_images
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладываем новый пост в ленты всех подписчиков автора."""
+    if not created:
+        return
+    followers = Follow.objects.filter(
+        author_id=instance.author_id).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post=instance, pub_date=instance.pub_date)
+         for user_id in followers.iterator()),
+        ignore_conflicts=True,
+    )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """После подписки докладываем в ленту уже опубликованные посты."""
+    if not created:
+        return
+    posts = Post.objects.filter(
+        author_id=instance.author_id).values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=instance.user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts.iterator()),
+        ignore_conflicts=True,
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    """После отписки убираем посты автора из ленты читателя."""
+    Timeline.objects.filter(
+        user_id=instance.user_id,
+        post__author_id=instance.author_id,
+    ).delete()
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, **kwargs):
+    """Запоминаем прежние группу, картинку и текст поста."""
+    instance._previous_group_id = None
+    instance._previous_image = ''
+    instance._previous_text = None
+    if instance.pk is not None:
+        (instance._previous_group_id, instance._previous_image,
+         instance._previous_text) = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image', 'text').first()
+            or (None, '', None)
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.POSTS)
+        counters.increment(counters.author_posts(instance.author_id))
+        if instance.group_id:
+            counters.increment(counters.group_posts(instance.group_id))
+        return
+    previous = getattr(instance, '_previous_group_id', None)
+    if previous != instance.group_id:
+        if previous:
+            counters.increment(counters.group_posts(previous), -1)
+        if instance.group_id:
+            counters.increment(counters.group_posts(instance.group_id))
+
+
+@receiver(post_save, sender=Post)
+def fingerprint_post(sender, instance, created, **kwargs):
+    """Подпись для поиска почти дублей; помечаем, если дубль нашёлся."""
+    if created or instance.text != getattr(instance, '_previous_text', None):
+        minhash.index_post(instance.pk, instance.text)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.increment(counters.POSTS, -1)
+    counters.increment(counters.author_posts(instance.author_id), -1)
+    if instance.group_id:
+        counters.increment(counters.group_posts(instance.group_id), -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.author_comments(instance.author_id))
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.increment(counters.author_comments(instance.author_id), -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.increment(counters.author_followers(instance.author_id))
+        counters.increment(counters.author_following(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.increment(counters.author_followers(instance.author_id), -1)
+    counters.increment(counters.author_following(instance.user_id), -1)
+
+
+def _post_scopes(post, *group_ids):
+    groups = Group.objects.filter(
+        pk__in=[pk for pk in group_ids if pk]).values_list('slug', flat=True)
+    return [cache.INDEX, cache.author_scope(post.author.username),
+            cache.post_scope(post.pk),
+            *(cache.group_scope(slug) for slug in groups)]
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_group_id', None)
+    cache.bump(*_post_scopes(instance, instance.group_id, previous))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    cache.bump(*_post_scopes(instance, instance.group_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    # Ленты комментариев не показывают: сбрасываем пост и профиль автора
+    cache.bump(cache.post_scope(instance.post_id),
+               cache.author_scope(instance.author.username))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_profiles(sender, instance, **kwargs):
+    cache.bump(cache.author_scope(instance.author.username),
+               cache.author_scope(instance.user.username))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_feed(sender, instance, **kwargs):
+    cache.bump(cache.group_scope(instance.slug))
+
+
+@receiver(post_save, sender=Post)
+def forget_replaced_image(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_image', '')
+    if not created and previous != instance.image.name:
+        default.kvstore.forget(previous, post_images)
+        default.kvstore.forget(instance.image.name, post_images)
+
+
+@receiver(post_delete, sender=Post)
+def forget_deleted_image(sender, instance, **kwargs):
+    default.kvstore.forget(instance.image.name, post_images)
+
+
+def _release_image(name):
+    """Снимаем ссылку на файл; последний пост уносит его после коммита."""
+    counters.increment(counters.media(name), -1)
+    transaction.on_commit(lambda: images.discard(name))
+
+
+@receiver(post_save, sender=Post)
+def count_image(sender, instance, created, **kwargs):
+    # Считаем ссылки только на файлы DedupStorage: старые имена
+    # могут делить несколько постов без всякого учёта
+    previous = '' if created else getattr(instance, '_previous_image', '')
+    current = instance.image.name
+    if previous == current:
+        return
+    if is_content_name(current):
+        counters.increment(counters.media(current))
+    if is_content_name(previous):
+        _release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_image(sender, instance, **kwargs):
+    if is_content_name(instance.image.name):
+        _release_image(instance.image.name)
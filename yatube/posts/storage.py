@@ -0,0 +1,57 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_content_name(name):
+    """Имя выдано DedupStorage, а не осталось от старых загрузок."""
+    return bool(name) and CONTENT_NAME.search(name) is not None
+
+
+@deconstructible
+class DedupStorage(FileSystemStorage):
+    """Хранилище, где имя файла — sha256 его содержимого.
+
+    posts/cat.png -> posts/3f/3f9a…c1.png. Повторная загрузка тех же
+    байтов ничего не пишет на диск и возвращает уже существующее имя,
+    поэтому и миниатюры sorl, и варианты у таких постов общие.
+    Сколько постов ссылается на файл, считает posts.signals.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        folder = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return os.path.join(folder, hexdigest[:2], hexdigest + ext)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def walk(self, path=''):
+        """Все файлы под path, кроме каталогов с вариантами картинок."""
+        directories, files = self.listdir(path)
+        for filename in files:
+            yield os.path.join(path, filename)
+        for directory in directories:
+            if directory != 'variants':
+                yield from self.walk(os.path.join(path, directory))
+
+
+post_images = DedupStorage()
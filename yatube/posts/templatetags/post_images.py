@@ -0,0 +1,96 @@
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from .. import images
+from ..thumbnails import (POST_GEOMETRY, POST_THUMBNAIL_OPTIONS,
+                          cached_thumbnail, geometries, schedule)
+
+register = template.Library()
+
+
+def _thumbnails(image):
+    found = {}
+    for geometry in geometries():
+        thumbnail = cached_thumbnail(image, geometry,
+                                     **POST_THUMBNAIL_OPTIONS)
+        if thumbnail is not None:
+            found[geometry] = thumbnail
+    return found
+
+
+@register.simple_tag(takes_context=True)
+def post_image(context, image, sizes=None, loading='lazy'):
+    """Картинка поста с srcset без генерации миниатюр во время запроса.
+
+    Если каких-то ширин ещё нет, ставим картинку в очередь. Без самой
+    широкой миниатюры отдаём заглушку и помечаем страницу, чтобы
+    cache_feed её не сохранил. Размеры берутся из KV-хранилища sorl.
+    """
+    if not image:
+        return ''
+    found = _thumbnails(image)
+    if len(found) < len(geometries()):
+        schedule(image.name)
+        if not settings.THUMBNAIL_WORKERS:
+            found = _thumbnails(image)
+    main = found.get(POST_GEOMETRY)
+    width, height = POST_GEOMETRY.split('x')
+    if main is None:
+        request = context.get('request')
+        if request is not None:
+            request.thumbnails_pending = True
+        return format_html(
+            '<img class="card-img my-2" src="{}" width="{}" height="{}" '
+            'alt="">', static('img/placeholder.svg'), width, height)
+    srcset = ', '.join(f'{thumbnail.url} {thumbnail.width}w'
+                       for thumbnail in found.values())
+    return format_html(
+        '<img class="card-img my-2" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="{}" alt="">',
+        main.url, srcset, sizes or settings.POST_IMAGE_SIZES,
+        main.width, main.height, loading)
+
+
+def _variants(name):
+    names = images.variants(name)
+    if all(map(default_storage.exists, names.values())):
+        return names
+    return None
+
+
+@register.simple_tag(takes_context=True)
+def post_picture(context, image, loading='eager'):
+    """Картинка поста целиком: <picture> с WebP и JPEG-вариантами.
+
+    Ширина и высота — из Post.image_width/image_height, так что файл
+    не открывается ни здесь, ни в KV-хранилище sorl. Пока варианты
+    не готовы, отдаём оригинал и не даём закэшировать страницу.
+    У старых постов без размеров — обычная миниатюра post_image.
+    """
+    if not image:
+        return ''
+    post = image.instance
+    if post.image_width is None or post.image_height is None:
+        return post_image(context, image, loading=loading)
+    names = _variants(image.name)
+    if names is None:
+        images.schedule(image.name)
+        if not settings.THUMBNAIL_WORKERS:
+            names = _variants(image.name)
+    if names is None:
+        request = context.get('request')
+        if request is not None:
+            request.thumbnails_pending = True
+        return format_html(
+            '<img class="card-img my-2" src="{}" width="{}" height="{}" '
+            'loading="{}" alt="">',
+            image.url, post.image_width, post.image_height, loading)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img class="card-img my-2" src="{}" width="{}" height="{}" '
+        'loading="{}" alt=""></picture>',
+        default_storage.url(names['webp']), default_storage.url(names['jpg']),
+        post.image_width, post.image_height, loading)
@@ -0,0 +1,216 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .. import counters, minhash, trending
+from ..models import (Comment, Counter, Follow, Post, PostFingerprint,
+                      Trending)
+from ..storage import is_content_name
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SEED_OPTIONS = {
+    'users': 30,
+    'groups': 3,
+    'posts': 120,
+    'comments': 50,
+    'follows_mean': 5,
+    'batch_size': 40,
+    'seed': 7,
+}
+
+
+class SeedDataTest(TestCase):
+    def seed(self, **options):
+        call_command('seed_data', stdout=StringIO(),
+                     **{**SEED_OPTIONS, **options})
+
+    def snapshot(self):
+        return list(Post.objects.order_by('pk').values_list(
+            'author__username', 'group__slug', 'text', 'pub_date'))
+
+    def test_seed_creates_requested_volume(self):
+        self.seed()
+        self.assertEqual(Post.objects.count(), SEED_OPTIONS['posts'])
+        self.assertEqual(Comment.objects.count(), SEED_OPTIONS['comments'])
+        self.assertTrue(Follow.objects.exists())
+
+    def test_seed_is_deterministic(self):
+        self.seed()
+        first = self.snapshot()
+        Post.objects.all().delete()
+        Counter.objects.filter(name__startswith='seed:').delete()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_seed_resumes_after_interruption(self):
+        self.seed()
+        expected = self.snapshot()
+        # Делаем вид, что последняя пачка постов не успела записаться
+        Post.objects.filter(
+            pk__in=Post.objects.order_by('-pk').values('pk')[:40]).delete()
+        Counter.objects.filter(name='seed:7:posts').update(value=2)
+        self.seed()
+        self.assertEqual(self.snapshot(), expected)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class DedupMediaTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def png(self, color):
+        content = BytesIO()
+        Image.new('RGB', (8, 8), color).save(content, 'PNG')
+        return ContentFile(content.getvalue())
+
+    def test_legacy_media_moved_and_orphans_removed(self):
+        user = User.objects.create_user(username='HasNoName')
+        legacy = default_storage.save('posts/legacy.png', self.png('red'))
+        orphan = default_storage.save('posts/orphan.png', self.png('blue'))
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(author=user, text=text, image=legacy)
+        call_command('dedup_media', grace=0, stdout=StringIO())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(is_content_name(name))
+        self.assertTrue(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertEqual(counters.value(counters.media(name)), 2)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.star = User.objects.create_user(username='star')
+        self.quiet = User.objects.create_user(username='quiet')
+        for i in range(20):
+            fan = User.objects.create_user(username=f'fan{i}')
+            Follow.objects.create(user=fan, author=self.star)
+        self.star_post = Post.objects.create(author=self.star, text='star')
+        self.quiet_post = Post.objects.create(author=self.quiet, text='q')
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(post=post, author=self.reader, text='!')
+
+    def update(self):
+        call_command('update_trending', stdout=StringIO())
+
+    def scores(self):
+        return dict(Trending.objects.values_list('post', 'score'))
+
+    def test_reach_outweighs_equal_comments(self):
+        self.comment(self.star_post, 2)
+        self.comment(self.quiet_post, 2)
+        self.update()
+        scores = self.scores()
+        self.assertGreater(scores[self.star_post.pk],
+                           scores[self.quiet_post.pk])
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.star_post, self.quiet_post])
+
+    def test_only_new_comments_are_read(self):
+        self.comment(self.quiet_post)
+        self.update()
+        first = self.scores()[self.quiet_post.pk]
+        self.assertEqual(counters.value(trending.LAST_COMMENT),
+                         Comment.objects.latest('pk').pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.update()
+        # Новых комментариев нет: группировки по комментариям не было
+        self.assertFalse(any('GROUP BY' in query['sql']
+                             for query in queries.captured_queries))
+        self.assertAlmostEqual(self.scores()[self.quiet_post.pk], first,
+                               places=3)
+        self.comment(self.quiet_post)
+        self.update()
+        self.assertAlmostEqual(self.scores()[self.quiet_post.pk],
+                               2 * first, places=3)
+
+    def test_comments_without_post_are_skipped(self):
+        Comment.objects.create(post=None, author=self.reader, text='?')
+        self.comment(self.quiet_post)
+        self.update()
+        self.assertEqual(list(self.scores()), [self.quiet_post.pk])
+        self.assertEqual(counters.value(trending.LAST_COMMENT),
+                         Comment.objects.latest('pk').pk)
+
+    def test_edited_post_refreshes_cached_page(self):
+        self.comment(self.quiet_post)
+        self.update()
+        url = reverse('posts:trending')
+        self.assertNotContains(self.client.get(url), 'Исправлено')
+        self.quiet_post.text = 'Исправлено'
+        self.quiet_post.save()
+        self.assertContains(self.client.get(url), 'Исправлено')
+
+    def test_scores_decay_and_table_is_trimmed(self):
+        self.comment(self.quiet_post)
+        now = timezone.now()
+        trending.update(now)
+        score = self.scores()[self.quiet_post.pk]
+        trending.update(now + timedelta(
+            hours=settings.TRENDING_HALF_LIFE))
+        self.assertAlmostEqual(self.scores()[self.quiet_post.pk],
+                               score / 2, places=3)
+        self.comment(self.star_post)
+        with self.settings(TRENDING_SIZE=1):
+            trending.update(now + timedelta(
+                hours=settings.TRENDING_HALF_LIFE))
+        self.assertEqual(list(self.scores()), [self.star_post.pk])
+
+
+class FingerprintPostsTest(TestCase):
+    text = ('Свежие новости о погоде на выходные: солнце, лёгкий ветер '
+            'и никаких дождей до понедельника')
+
+    def test_historical_posts_indexed_and_flagged(self):
+        user = User.objects.create_user(username='historian')
+        Post.objects.bulk_create([
+            Post(author=user, text=self.text),
+            Post(author=user, text='Короткий'),
+            Post(author=user, text=self.text.replace('солнце', 'тепло')),
+        ])
+        original, short, copy = Post.objects.order_by('pk')
+        self.assertFalse(PostFingerprint.objects.exists())
+        out = StringIO()
+        call_command('fingerprint_posts', batch_size=2, stdout=out)
+        self.assertIn('Подписей: 2, почти дублей: 1', out.getvalue())
+        self.assertEqual(PostFingerprint.objects.get(post=copy).duplicate_of,
+                         original)
+        self.assertIsNone(
+            PostFingerprint.objects.get(post=original).duplicate_of)
+        call_command('fingerprint_posts', stdout=out)
+        self.assertEqual(PostFingerprint.objects.count(), 2)
+
+    def test_similarity_follows_shared_words(self):
+        original = minhash.signature(self.text)
+        edited = minhash.signature(self.text.replace('солнце', 'тепло'))
+        other = minhash.signature(
+            'Совсем другая история про поездку на море, горы '
+            'и долгую дорогу домой')
+        self.assertGreaterEqual(minhash.similarity(original, edited), 0.6)
+        self.assertLess(minhash.similarity(original, other), 0.1)
+        self.assertEqual(minhash.unpack(minhash.pack(original)), original)
+        self.assertTrue(set(minhash.buckets(original))
+                        & set(minhash.buckets(edited)))
@@ -1,5 +1,9 @@
+import hashlib
+import os
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.views import redirect_to_login
@@ -8,14 +12,18 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image
 
-from ..models import Group, Post, Comment
+from .. import counters, images
+from ..models import Group, Post, Comment, PostFingerprint
+from ..storage import post_images
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostFormTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -78,13 +86,134 @@ class PostFormTest(TestCase):
         self.assertEqual(Post.objects.count(), posts_count)
         first_post = Post.objects.first()
         self.assertEqual(first_post.text, PostFormTest.post.text)
+        # Картинки хранятся под sha256 содержимого
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 text=self.post.text,
-                image='posts/small.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
 
+    def test_PostForm_failed_receiver_rolls_back_post(self):
+        """Упавший сигнал откатывает и пост, и счётчики, и ленты."""
+        posts = counters.value(counters.POSTS)
+        with mock.patch('posts.signals.minhash.index_post',
+                        side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Не сохранится'})
+        self.assertFalse(Post.objects.filter(text='Не сохранится').exists())
+        self.assertEqual(counters.value(counters.POSTS), posts)
+
+    def test_PostForm_same_image_stored_once(self):
+        content = BytesIO()
+        Image.new('RGB', (20, 10), 'blue').save(content, 'PNG')
+        for text in ('Первая копия', 'Вторая копия'):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': text, 'image': SimpleUploadedFile(
+                    f'{text}.png', content.getvalue(), 'image/png')},
+            )
+        names = set(Post.objects.filter(text__endswith='копия')
+                    .values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(len(post_images.listdir(os.path.dirname(name))[1]),
+                         1)
+        self.assertEqual(counters.value(counters.media(name)), 2)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_PostForm_create_ingests_image(self):
+        """Большая картинка уменьшается, теряет EXIF и получает варианты."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile('big.jpg', buffer.getvalue(),
+                                      content_type='image/jpeg')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С большой картинкой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='С большой картинкой')
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with default_storage.open(post.image.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (100, 50))
+            self.assertFalse(image.getexif())
+        for ext, name in images.variants(post.image.name).items():
+            with self.subTest(ext=ext):
+                self.assertTrue(default_storage.exists(name))
+        # Страница поста отдаёт варианты с размерами из модели
+        variants = images.variants(post.image.name)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(
+            response, '<source type="image/webp" srcset="{}">'.format(
+                default_storage.url(variants['webp'])))
+        self.assertContains(response, 'src="{}" width="100" height="50"'
+                            .format(default_storage.url(variants['jpg'])))
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_PostForm_create_ingests_mpo(self):
+        """MPO с камеры сохраняется первым кадром JPEG без EXIF."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(
+            buffer, 'MPO', save_all=True, exif=exif,
+            append_images=[Image.new('RGB', (400, 200), 'blue')])
+        uploaded = SimpleUploadedFile('stereo.jpg', buffer.getvalue(),
+                                      content_type='image/jpeg')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Со стереопарой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Со стереопарой')
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with default_storage.open(post.image.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
+            self.assertFalse(getattr(image, 'is_animated', False))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_PostForm_animation_keeps_frames_without_exif(self):
+        """Анимация сохраняет кадры, теряет EXIF, а большая отклоняется."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        frames = [Image.new('RGB', (60, 30), color)
+                  for color in ('red', 'blue')]
+        buffer = BytesIO()
+        frames[0].save(buffer, 'WEBP', save_all=True, exif=exif,
+                       append_images=frames[1:], duration=100)
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С анимацией', 'image': SimpleUploadedFile(
+                'anim.webp', buffer.getvalue(), 'image/webp')},
+        )
+        post = Post.objects.get(text='С анимацией')
+        with default_storage.open(post.image.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.n_frames, 2)
+            self.assertFalse(image.getexif())
+        big = BytesIO()
+        frames = [Image.new('RGB', (400, 200), color)
+                  for color in ('red', 'blue')]
+        frames[0].save(big, 'GIF', save_all=True, append_images=frames[1:])
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С большой анимацией', 'image': SimpleUploadedFile(
+                'big.gif', big.getvalue(), 'image/gif')},
+        )
+        self.assertFormError(response, 'form', 'image',
+                             'Анимация больше 100 px по большей стороне')
+        self.assertFalse(
+            Post.objects.filter(text='С большой анимацией').exists())
+
     def test_PostForm_edit(self):
         """Тестируем PostForm."""
         form_data = {
@@ -166,3 +295,46 @@ class PostFormTest(TestCase):
                              reverse('posts:post_detail',
                                      kwargs={'post_id': self.post.pk}))
         self.assertEqual(Comment.objects.count(), comments_count + 1)
+
+
+SPAM = ('Купите лучшие часы со скидкой прямо сейчас, '
+        'доставка по всей стране бесплатно')
+
+
+class DuplicatePostTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='poster')
+        self.client.force_login(self.user)
+        self.original = Post.objects.create(author=self.user, text=SPAM)
+
+    def create(self, text):
+        return self.client.post(reverse('posts:post_create'),
+                                {'text': text})
+
+    def test_near_duplicate_is_flagged(self):
+        self.create(SPAM.replace('лучшие', 'отличные'))
+        copy = Post.objects.latest('pk')
+        self.assertNotEqual(copy, self.original)
+        self.assertEqual(copy.fingerprint.duplicate_of, self.original)
+        self.create('Совсем другая история про поездку на море, '
+                    'горы и долгую дорогу домой')
+        self.assertIsNone(Post.objects.latest('pk').fingerprint.duplicate_of)
+
+    @override_settings(POST_DUPLICATES='reject')
+    def test_near_duplicate_is_rejected(self):
+        count = Post.objects.count()
+        response = self.create(SPAM + '!!!')
+        self.assertFormError(response, 'form', 'text',
+                             'Почти такая же запись уже опубликована')
+        self.assertEqual(Post.objects.count(), count)
+        # Правка самого поста не считается дублем самого себя
+        response = self.client.post(
+            reverse('posts:post_edit',
+                    kwargs={'post_id': self.original.pk}),
+            {'text': SPAM + '!'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_short_texts_are_not_compared(self):
+        self.create('Привет')
+        self.assertFalse(PostFingerprint.objects.filter(
+            post__text='Привет').exists())
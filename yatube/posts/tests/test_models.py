@@ -1,7 +1,17 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
 
-from ..models import Group, Post
+from .. import counters, hll
+from ..buffers import SketchBuffer, post_visitors
+from ..models import (Comment, Counter, Follow, Group, Post,
+                      VisitorSketch)
 
 User = get_user_model()
 
@@ -28,3 +38,169 @@ class PostModelTest(TestCase):
         self.assertEqual(group, PostModelTest.group.title, 'Not good')
         post = str(PostModelTest.post)
         self.assertEqual(post, PostModelTest.post.text[:15], 'Not good')
+
+
+class FollowModelTest(TestCase):
+    def test_follow_is_unique(self):
+        """Подписка на одного автора хранится один раз."""
+        user = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='writer')
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+
+
+class CounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def test_signals_keep_counters_in_sync(self):
+        """Счётчики совпадают с COUNT(*) после правок и удалений."""
+        post = Post.objects.create(author=self.user, text='1',
+                                   group=self.group)
+        Post.objects.create(author=self.user, text='2')
+        Comment.objects.create(author=self.reader, post=post, text='ок')
+        Follow.objects.create(user=self.reader, author=self.user)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(counters.value(counters.POSTS), 2)
+        self.assertEqual(
+            counters.value(counters.group_posts(self.group.pk)), 0)
+        self.assertEqual(
+            counters.value(counters.group_posts(self.other_group.pk)), 1)
+        self.assertEqual(counters.author_stats(self.user.pk)['posts_count'], 2)
+        self.assertEqual(
+            counters.author_stats(self.user.pk)['followers_count'], 1)
+        self.assertEqual(
+            counters.author_stats(self.reader.pk)['comments_count'], 1)
+        self.assertEqual(
+            counters.recompute()[counters.author_posts(self.user.pk)], 2)
+        post.delete()
+        self.assertEqual(counters.value(counters.POSTS), 1)
+        self.assertEqual(
+            counters.author_stats(self.reader.pk)['comments_count'], 0)
+        self.assertEqual(counters.recompute()[counters.POSTS], 1)
+
+    def test_repair_counters_command(self):
+        Post.objects.create(author=self.user, text='1', group=self.group)
+        Counter.objects.all().delete()
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(counters.value(counters.POSTS), 1)
+        self.assertEqual(
+            counters.value(counters.group_posts(self.group.pk)), 1)
+
+
+class HyperLogLogTest(TestCase):
+    def test_estimate_close_to_exact(self):
+        for size in (10, 1000, 50_000):
+            sketch = hll.HyperLogLog()
+            for value in range(size):
+                sketch.add(value)
+                sketch.add(value)
+            with self.subTest(size=size):
+                self.assertAlmostEqual(sketch.count() / size, 1, delta=0.05)
+
+    def test_merge_counts_shared_values_once(self):
+        monday, tuesday = hll.HyperLogLog(), hll.HyperLogLog()
+        for value in range(3000):
+            monday.add(value)
+        for value in range(2000, 5000):
+            tuesday.add(value)
+        both = hll.HyperLogLog.from_bytes((monday | tuesday).to_bytes())
+        self.assertAlmostEqual(both.count() / 5000, 1, delta=0.05)
+        self.assertEqual(len(both.to_bytes()), hll.REGISTERS)
+
+
+class VisitorSketchTest(TestCase):
+    day = date(2026, 1, 1)
+
+    def setUp(self):
+        self.buffer = SketchBuffer(size=10_000, interval=3600)
+
+    def test_flush_merges_with_stored_sketch(self):
+        for visitor in range(300):
+            self.buffer.add(visitor, day=self.day, post=1, author=2)
+        self.buffer.flush()
+        # Другой процесс: часть читателей та же
+        other = SketchBuffer(size=10_000, interval=3600)
+        for visitor in range(200, 400):
+            other.add(visitor, day=self.day, post=1)
+        other.flush()
+        self.assertEqual(VisitorSketch.objects.count(), 2)
+        self.assertAlmostEqual(
+            hll.unique(VisitorSketch.POST, 1) / 400, 1, delta=0.05)
+        self.assertAlmostEqual(
+            hll.unique(VisitorSketch.AUTHOR, 2) / 300, 1, delta=0.05)
+
+    def test_concurrent_write_is_retried(self):
+        for visitor in range(100):
+            self.buffer.add(visitor, day=self.day, group=5)
+        self.buffer.flush()
+        for visitor in range(100, 200):
+            self.buffer.add(visitor, day=self.day, group=5)
+        rows = SketchBuffer._rows
+        intruder = hll.HyperLogLog()
+        for visitor in range(200, 300):
+            intruder.add(visitor)
+
+        def rows_then_race(buffer, keys):
+            found = rows(buffer, keys)
+            if not intruder.registers.count(0) == hll.REGISTERS:
+                # Скетч меняют между нашим чтением и записью
+                row = VisitorSketch.objects.get(kind='group')
+                VisitorSketch.objects.filter(pk=row.pk).update(sketch=(
+                    hll.HyperLogLog.from_bytes(row.sketch)
+                    | intruder).to_bytes())
+                intruder.registers = bytearray(hll.REGISTERS)
+            return found
+
+        with mock.patch.object(SketchBuffer, '_rows', rows_then_race):
+            self.buffer.flush()
+        self.assertAlmostEqual(
+            hll.unique(VisitorSketch.GROUP, 5) / 300, 1, delta=0.05)
+
+    def test_post_detail_records_readers(self):
+        user = User.objects.create_user(username='writer')
+        post = Post.objects.create(author=user, text='Читают')
+        post_visitors.clear()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.client.get(url)
+        self.client.force_login(user)
+        self.client.get(url)
+        self.client.get(url)
+        post_visitors.flush()
+        self.assertEqual(hll.unique(VisitorSketch.POST, post.pk), 2)
+        self.assertEqual(hll.unique(VisitorSketch.AUTHOR, user.pk), 2)
+        self.assertFalse(
+            VisitorSketch.objects.filter(kind=VisitorSketch.GROUP).exists())
+
+    def test_admin_estimates_selected_days(self):
+        for day, visitors in ((1, range(0, 50)), (2, range(25, 75))):
+            for visitor in visitors:
+                self.buffer.add(visitor, day=date(2026, 1, day), post=7)
+        self.buffer.flush()
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:posts_visitorsketch_changelist'),
+            {'action': 'estimate_selected',
+             '_selected_action': list(
+                 VisitorSketch.objects.values_list('pk', flat=True))},
+            follow=True)
+        message, = [str(message) for message in response.context['messages']]
+        estimate = int(message.rsplit('≈', 1)[1])
+        self.assertAlmostEqual(estimate / 75, 1, delta=0.05)
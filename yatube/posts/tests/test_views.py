@@ -10,14 +10,29 @@ from django import forms
 from django.core.paginator import Page
 from yatube.settings import QUANTITY
 from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from sorl.thumbnail import default
 
-from ..models import Post, Group, Follow
+from .. import cache as feed_cache, counters
+from ..buffers import post_views, post_visitors
+from ..models import Comment, Post, Group, Follow, Timeline
+from ..paginators import CursorPaginator, MergePaginator
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -235,6 +250,151 @@ class PaginationTest(TestCase):
         self.assertEqual(len(page_obj), self.second_quantity)
 
 
+@override_settings(CURSOR_PAGINATION=True)
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug=3
+        )
+        for i in range(15):
+            Post.objects.create(
+                author=cls.user,
+                text=f'{i}',
+                group=cls.group
+            )
+        cls.second_quantity = Post.objects.count() - QUANTITY
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_walk_forward_and_back(self):
+        """По курсорам лента проходится вперёд и назад без пропусков."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:posts_group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertTrue(first.is_cursor)
+                self.assertEqual(len(first), QUANTITY)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    url, {'after': first.next_cursor}).context['page_obj']
+                self.assertEqual(len(second), self.second_quantity)
+                self.assertFalse(second.has_next())
+                self.assertFalse(
+                    set(first.object_list) & set(second.object_list))
+                back = self.client.get(
+                    url,
+                    {'before': second.previous_cursor}).context['page_obj']
+                self.assertEqual(back.object_list, first.object_list)
+
+    def test_broken_cursor_gives_first_page(self):
+        response = self.client.get(reverse('posts:index'), {'after': '!!'})
+        self.assertEqual(len(response.context['page_obj']), QUANTITY)
+
+    def test_cursor_walks_index_without_sorting(self):
+        """Продолжение с курсора идёт по индексу, без сортировки хвоста."""
+        post = Post.objects.order_by('pub_date', 'pk')[QUANTITY]
+        cursor = post.pub_date, post.pk
+        querysets = (
+            Post.objects.all(),
+            Post.objects.filter(author=self.user),
+            Post.objects.filter(group=self.group),
+        )
+        for queryset in querysets:
+            for backwards in (False, True):
+                with self.subTest(query=str(queryset.query),
+                                  backwards=backwards):
+                    plan = CursorPaginator(queryset, QUANTITY).ordered(
+                        cursor, backwards)[:QUANTITY + 1].explain()
+                    self.assertIn('USING INDEX', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertNotIn('MULTI-INDEX OR', plan)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTest(TestCase):
+    """Миниатюры режутся вне запроса, а до тех пор видна заглушка."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='С картинкой',
+            image=SimpleUploadedFile('thumb.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.flush()
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_placeholder_until_thumbnail_ready(self):
+        url = reverse('posts:index')
+        with mock.patch('posts.thumbnails._get_executor') as executor:
+            response = self.client.get(url)
+        self.assertContains(response, 'img/placeholder.svg')
+        executor.return_value.submit.assert_called_once()
+        # Страница с заглушкой не попадает в кэш
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_thumbnail_shown_when_ready(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'img/placeholder.svg')
+        self.assertContains(response, 'cache/')
+
+    @override_settings(POST_IMAGE_WIDTHS=(320, 640))
+    def test_srcset_lists_every_width(self):
+        content = self.client.get(reverse('posts:index')).content.decode()
+        for width in ('320w', '640w', '960w'):
+            with self.subTest(width=width):
+                self.assertIn(width, content)
+        self.assertIn('width="960" height="339" loading="lazy"', content)
+
+    def test_thumbnail_metadata_served_from_lru(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        cache.clear()
+        default.kvstore.reset_stats()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([query for query in queries
+                          if 'thumbnail_kvstore' in query['sql']])
+        self.assertEqual(default.kvstore.stats()['misses'], 0)
+        self.assertGreater(default.kvstore.stats()['hits'], 0)
+
+    def test_lru_is_bounded(self):
+        with self.settings(THUMBNAIL_LRU_SIZE=1):
+            self.client.get(reverse('posts:index'))
+            self.assertEqual(default.kvstore.stats()['size'], 1)
+
+    def test_new_image_evicts_old_metadata(self):
+        self.client.get(reverse('posts:index'))
+        self.assertGreater(default.kvstore.stats()['size'], 0)
+        post = Post.objects.get(pk=self.post.pk)
+        # Другие байты: одинаковые DedupStorage хранит под тем же именем
+        post.image = SimpleUploadedFile('other.gif', SMALL_GIF + b'\x00',
+                                        'image/gif')
+        post.save()
+        self.assertEqual(default.kvstore.stats()['size'], 0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
 class CacheTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -276,6 +436,201 @@ class CacheTest(TestCase):
         self.assertEqual(page_obj_1, page_obj_2)
 
 
+class FeedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='cached'
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            description='Тестовый текст',
+            slug='other'
+        )
+        cls.post = Post.objects.create(author=cls.user, text='Первый',
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_invalidates_index_at_once(self):
+        url = reverse('posts:index')
+        self.assertIsNotNone(self.client.get(url).context)
+        # Второй запрос отдаётся из кэша, шаблон не рендерится
+        self.assertIsNone(self.client.get(url).context)
+        post = Post.objects.create(author=self.user, text='Свежий')
+        response = self.client.get(url)
+        self.assertIn(post, response.context['page_obj'].object_list)
+
+    def test_other_group_post_keeps_group_page_cached(self):
+        url = reverse('posts:posts_group', kwargs={'slug': self.group.slug})
+        self.client.get(url)
+        Post.objects.create(author=self.user, text='Чужой',
+                            group=self.other_group)
+        self.assertIsNone(self.client.get(url).context)
+        Post.objects.create(author=self.user, text='Свой', group=self.group)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_bump_reaches_other_workers(self):
+        """Версии в Counter: сброс из другого процесса виден и этому."""
+        scope = feed_cache.group_scope('Тестовый слаг')
+        key = feed_cache._version_key(scope)
+        self.assertTrue(key.isascii())
+        url = reverse('posts:posts_group', kwargs={'slug': self.group.slug})
+        self.client.get(url)
+        self.assertIsNone(self.client.get(url).context)
+        # Другой воркер поднимает только общую версию, наш кэш не трогает
+        counters.advance(
+            [feed_cache._version_key(feed_cache.group_scope(self.group.slug))],
+            0)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_revalidation_gets_304_until_feed_changes(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Только чтение версий из Counter
+        self.assertEqual(len(queries), 1)
+        Post.objects.create(author=self.user, text='Свежий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_detail_revalidation_sees_new_comment(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(author=self.user, post=self.post, text='Да')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_revalidation_sees_new_csrf_token(self):
+        """После входа токен формы комментария другой: 304 нельзя."""
+        self.client.force_login(self.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        # Первый ответ ставит CSRF-куку, ETag берём уже с ней
+        self.assertIn(settings.CSRF_COOKIE_NAME,
+                      self.client.get(url).cookies)
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Так выглядит повторный вход: Django выдаёт новый токен
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'rotated'
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class SyndicationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='rss'
+        )
+        cls.post = Post.objects.create(author=cls.user, text='В ленте',
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def urls(self):
+        return (
+            reverse('posts:index_rss'),
+            reverse('posts:index_atom'),
+            reverse('posts:group_rss', kwargs={'slug': self.group.slug}),
+            reverse('posts:group_atom', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile_rss',
+                    kwargs={'username': self.user.username}),
+            reverse('posts:profile_atom',
+                    kwargs={'username': self.user.username}),
+        )
+
+    def test_feeds_list_posts(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'В ленте')
+
+    def test_feed_cached_until_new_post(self):
+        url = reverse('posts:group_rss', kwargs={'slug': self.group.slug})
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(url), 'В ленте')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый')
+
+
+# Читатели копятся в буфере и не пишутся посреди замера
+@override_settings(VISITOR_BUFFER_SIZE=10 ** 6,
+                   VISITOR_BUFFER_INTERVAL=10 ** 6)
+class QueryCountTest(TestCase):
+    """Число запросов страницы не растёт вместе с её содержимым."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(post_visitors.clear)
+        self.reader = User.objects.create_user(username='reader')
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(
+            title='Тестовый заголовок',
+            description='Тестовый текст',
+            slug='queries'
+        )
+        self.authors = []
+
+    def add_posts(self, count):
+        for _ in range(count):
+            number = len(self.authors)
+            author = User.objects.create_user(username=f'author{number}')
+            self.authors.append(author)
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(author=author, text=f'{number}',
+                                       group=self.group)
+            Comment.objects.create(author=author, post=post, text='к посту')
+            Comment.objects.create(author=author, post=self.first_post,
+                                   text='к первому')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:posts_group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.authors[0].username}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': self.first_post.pk}),
+            reverse('posts:follow_index'),
+        )
+
+    def test_query_count_is_constant(self):
+        self.first_post = Post.objects.create(
+            author=self.reader, text='Первый', group=self.group)
+        self.add_posts(1)
+        before = {url: self.count_queries(url) for url in self.urls()}
+        self.add_posts(9)
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), before[url])
+
+
 class FollowTests(TestCase):
 
     def setUp(self):
@@ -323,6 +678,78 @@ class FollowTests(TestCase):
         len_follow_objects = len(Follow.objects.all())
         self.assertEqual(len_follow_objects, 1)
 
+    def test_new_post_fans_out_and_unfollow_trims(self):
+        Follow.objects.create(author=self.user2, user=self.user1)
+        post = Post.objects.create(author=self.user2, text='TEST TIMELINE')
+        self.assertTrue(
+            Timeline.objects.filter(user=self.user1, post=post).exists())
+        response = self.authorized_client1.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'].object_list)
+
+        self.authorized_client1.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user2.username}))
+        self.assertFalse(Timeline.objects.filter(user=self.user1).exists())
+
+    @override_settings(FOLLOW_FEED_ENGINE='merge')
+    def test_merge_engine_matches_timeline(self):
+        user3 = User.objects.create_user(username='HasNoName3')
+        for i in range(8):
+            Post.objects.create(author=self.user2, text=f'A{i}')
+            Post.objects.create(author=user3, text=f'B{i}')
+        Follow.objects.create(author=self.user2, user=self.user1)
+        Follow.objects.create(author=user3, user=self.user1)
+        expected = list(Post.objects.filter(
+            author__in=(self.user2, user3)).order_by('-pub_date', '-pk'))
+
+        url = reverse('posts:follow_index')
+        first = self.authorized_client1.get(url).context['page_obj']
+        second = self.authorized_client1.get(
+            url, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual(first.object_list, expected[:QUANTITY])
+        self.assertEqual(second.object_list, expected[QUANTITY:])
+        self.assertFalse(second.has_next())
+
+    def test_timeline_pages_without_count_and_by_cursor(self):
+        Follow.objects.create(author=self.user2, user=self.user1)
+        for i in range(15):
+            Post.objects.create(author=self.user2, text=f'T{i}')
+        expected = list(Post.objects.filter(author=self.user2)
+                        .order_by('-pub_date', '-pk'))
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as queries:
+            first = self.authorized_client1.get(url).context['page_obj']
+        self.assertEqual(first.paginator.count, len(expected))
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries.captured_queries))
+        with override_settings(CURSOR_PAGINATION=True):
+            first = self.authorized_client1.get(url).context['page_obj']
+            second = self.authorized_client1.get(
+                url, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual(first.object_list, expected[:QUANTITY])
+        self.assertEqual(second.object_list, expected[QUANTITY:])
+        self.assertFalse(second.has_next())
+
+    def test_merge_reads_quiet_authors_once(self):
+        """Тихие ленты дают по одной строке, порции растут у активной."""
+        quiet = [User.objects.create_user(username=f'quiet{i}')
+                 for i in range(5)]
+        for author in quiet:
+            Post.objects.create(author=author, text='old')
+        for i in range(30):
+            Post.objects.create(author=self.user2, text=f'A{i}')
+        paginator = MergePaginator(
+            [Post.objects.filter(author=author)
+             for author in [self.user2, *quiet]], QUANTITY)
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.get_page()
+        self.assertEqual(
+            page.object_list,
+            list(Post.objects.filter(author=self.user2)
+                 .order_by('-pub_date', '-pk')[:QUANTITY]))
+        # По запросу на источник и ещё log2 страницы на активный
+        self.assertLessEqual(len(queries), len(quiet) + 5)
+
     def test_guest_follow(self):
         self.post = Post.objects.create(
             author=self.user2,
@@ -333,3 +760,287 @@ class FollowTests(TestCase):
         page_obj = response1.context.get('page_obj').object_list
 
         self.assertEqual(len(page_obj), 0)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Сад', slug='garden', description='Про сад')
+        cls.best = Post.objects.create(
+            author=cls.user, group=cls.group, text='яблоня яблоня яблоня')
+        cls.good = Post.objects.create(
+            author=cls.other, text='яблоня и груша растут в саду, '
+                                   'а рядом ещё много других деревьев')
+        Post.objects.create(author=cls.user, text='только груша')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        return self.client.get(reverse('posts:search'), params).context
+
+    def test_results_ranked_and_highlighted(self):
+        context = self.get(q='яблоня')
+        self.assertEqual(context['posts'], [self.best, self.good])
+        self.assertIn('<mark>яблоня</mark>', context['posts'][0].snippet)
+
+    def test_prefix_and_empty_query(self):
+        self.assertEqual(len(self.get(q='ябл')['posts']), 2)
+        self.assertEqual(self.get(q='')['posts'], [])
+        self.assertEqual(self.get(q='"*()')['posts'], [])
+
+    def test_snippet_escapes_html(self):
+        Post.objects.create(author=self.user, text='<b>слива</b>')
+        snippet = self.get(q='слива')['posts'][0].snippet
+        self.assertIn('&lt;b&gt;<mark>слива</mark>', snippet)
+
+    def test_filters(self):
+        self.assertEqual(self.get(q='яблоня', group='garden')['posts'],
+                         [self.best])
+        self.assertEqual(self.get(q='яблоня', author='other')['posts'],
+                         [self.good])
+        self.assertEqual(self.get(q='яблоня', author='nobody')['posts'], [])
+
+    def test_cursor_pages(self):
+        for i in range(QUANTITY + 2):
+            Post.objects.create(author=self.user, text=f'вишня {i}')
+        first = self.get(q='вишня')
+        self.assertEqual(len(first['posts']), QUANTITY)
+        after = first['next_query'].split('after=')[1]
+        second = self.get(q='вишня', after=after)
+        self.assertEqual(len(second['posts']), 2)
+        self.assertIsNone(second['next_query'])
+        self.assertFalse(set(first['posts']) & set(second['posts']))
+
+    def test_index_follows_updates_and_deletes(self):
+        Post.objects.filter(pk=self.best.pk).update(text='слива')
+        self.assertEqual(self.get(q='яблоня')['posts'], [self.good])
+        self.assertEqual(len(self.get(q='слива')['posts']), 1)
+        Post.objects.get(pk=self.good.pk).delete()
+        self.assertEqual(self.get(q='яблоня')['posts'], [])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'груша'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         set(Post.objects.filter(text__contains='груша')))
+
+
+@override_settings(COMMENTS_PAGE_SIZE=3)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commenter')
+        cls.post = Post.objects.create(author=cls.user, text='Вирусный')
+        for i in range(7):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_detail_embeds_first_page_and_fragments_follow(self):
+        expected = list(self.post.comments.order_by('created', 'pk'))
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        page = response.context['comments']
+        seen = list(page)
+        self.assertEqual(len(seen), 3)
+        url = reverse('posts:post_comments',
+                      kwargs={'post_id': self.post.pk})
+        while page.has_next():
+            response = self.client.get(url, {'after': page.next_cursor})
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            self.assertNotContains(response, '<html')
+            page = response.context['comments']
+            seen += list(page)
+        self.assertEqual(seen, expected)
+
+    def test_fragment_for_missing_post_is_404(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 999}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_xhr_comment_returns_fragment(self):
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        response = self.client.post(url, {'text': 'Через fetch'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 201)
+        self.assertTemplateUsed(response, 'includes/comment_item.html')
+        self.assertContains(response, 'Через fetch', status_code=201)
+        self.assertNotContains(response, 'Комментарий 0', status_code=201)
+
+        response = self.client.post(url, {'text': ''},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+
+    def test_invalid_comment_renders_only_first_page(self):
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        response = self.client.post(url, {'text': ''})
+        self.assertEqual(len(response.context['comments']), 3)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=20, COMMENTS_MAX_DEPTH=3,
+                   COMMENTS_EAGER_DEPTH=2)
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='threader')
+        cls.post = Post.objects.create(author=cls.user, text='Обсуждение')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def reply(self, text, parent=None):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': text, 'parent': parent.pk if parent else ''})
+        return Comment.objects.get(text=text)
+
+    def texts(self, page):
+        return [comment.text for comment in page]
+
+    def test_thread_rendered_depth_first_in_one_range(self):
+        first = self.reply('1')
+        second = self.reply('2')
+        answer = self.reply('1.1', first)
+        self.reply('2.1', second)
+        self.reply('1.2', first)
+        self.reply('1.1.1', answer)
+        self.assertEqual(answer.depth, 1)
+        self.assertTrue(answer.path.startswith(first.path))
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url).context['comments']
+        self.assertEqual(self.texts(page), ['1', '1.1', '1.2', '2', '2.1'])
+        # Страница дерева и подсчёт скрытых ответов — без рекурсии
+        self.assertEqual(
+            sum('posts_comment' in query['sql']
+                for query in queries.captured_queries), 2)
+        self.assertEqual(page[1].hidden_replies, 1)
+
+        response = self.client.get(reverse(
+            'posts:comment_replies',
+            kwargs={'post_id': self.post.pk, 'comment_id': answer.pk}))
+        self.assertEqual(self.texts(response.context['comments']),
+                         ['1.1.1'])
+
+    def test_depth_is_capped(self):
+        parent = self.reply('0')
+        for depth in range(1, 6):
+            parent = self.reply(str(depth), parent)
+        self.assertEqual(
+            Comment.objects.order_by('-depth').first().depth, 3)
+        self.assertEqual(parent.parent.depth, 2)
+
+    def test_foreign_or_broken_parent_gives_root(self):
+        other = Post.objects.create(author=self.user, text='Другой')
+        foreign = Comment.objects.create(post=other, author=self.user,
+                                         text='чужой')
+        self.assertIsNone(self.reply('a', foreign).parent)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'b', 'parent': 'x'})
+        self.assertEqual(Comment.objects.get(text='b').depth, 0)
+
+    def test_bulk_created_comments_get_root_paths(self):
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'{i}')
+            for i in range(3))
+        Comment.objects.filter(path='').update(path=Comment.root_path())
+        self.assertEqual(
+            list(self.post.comments.order_by('path').values_list(
+                'path', flat=True)),
+            [Comment.segment(pk) for pk in self.post.comments.order_by(
+                'pk').values_list('pk', flat=True)])
+
+
+@override_settings(VIEW_BUFFER_SIZE=5, VIEW_BUFFER_INTERVAL=3600)
+class ViewCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='viewed')
+        cls.post = Post.objects.create(author=cls.user, text='Смотрят')
+        cls.other = Post.objects.create(author=cls.user, text='Реже')
+
+    def setUp(self):
+        cache.clear()
+        post_views.clear()
+
+    def stored(self, post):
+        return Post.objects.values_list('views', flat=True).get(pk=post.pk)
+
+    def test_views_buffered_until_threshold(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        for number in range(1, 5):
+            response = self.client.get(url)
+            self.assertEqual(response.context['views'], number)
+        self.assertEqual(self.stored(self.post), 0)
+        self.client.get(url)
+        self.assertEqual(self.stored(self.post), 5)
+        self.assertEqual(post_views.pending(self.post.pk), 0)
+
+    def test_revalidated_visits_are_counted(self):
+        """304 тоже просмотр: и в счётчике, и в читателях."""
+        self.addCleanup(post_visitors.clear)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(post_visitors, 'add') as add_visitor:
+            for _ in range(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        self.assertEqual(add_visitor.call_count, 3)
+        self.assertEqual(post_views.live(self.post.pk, self.stored(self.post)),
+                         4)
+
+    def test_failed_flush_keeps_page_and_views(self):
+        """База занята: страница открывается, просмотр ждёт в буфере."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        locked = DatabaseError('database is locked')
+        with self.settings(VIEW_BUFFER_SIZE=1), \
+                mock.patch.object(post_views, '_write', side_effect=locked), \
+                self.assertLogs('posts.buffers', level='ERROR'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(post_views.pending(self.post.pk), 1)
+        with self.assertRaises(DatabaseError), \
+                mock.patch.object(post_views, '_write', side_effect=locked):
+            post_views.flush()
+        post_views.flush()
+        self.assertEqual(self.stored(self.post), 1)
+
+    def test_flush_is_one_statement_for_many_posts(self):
+        post_views.add(self.post.pk, 3)
+        post_views.add(self.other.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(post_views.flush(), 2)
+        self.assertEqual(self.stored(self.post), 3)
+        self.assertEqual(self.stored(self.other), 1)
+        with self.assertNumQueries(0):
+            post_views.flush()
+
+    def test_interval_triggers_flush(self):
+        post_views.add(self.post.pk)
+        with self.settings(VIEW_BUFFER_INTERVAL=0):
+            post_views.add(self.post.pk)
+        self.assertEqual(self.stored(self.post), 2)
+
+    def test_edit_keeps_flushed_views(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post_views.add(post.pk, 4)
+        post_views.flush()
+        post.text = 'Правка'
+        post.save()
+        self.assertEqual(self.stored(post), 4)
@@ -0,0 +1,98 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .storage import post_images
+
+logger = logging.getLogger(__name__)
+
+# Самая широкая миниатюра карточки поста и опции sorl для всех ширин
+POST_GEOMETRY = '960x339'
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+        return _executor
+
+
+def cached_thumbnail(file_, geometry, **options):
+    """Готовая миниатюра из KV-хранилища sorl или None.
+
+    Повторяет подготовку опций из ThumbnailBackend.get_thumbnail,
+    но никогда не открывает и не масштабирует исходник.
+    """
+    backend = default.backend
+    source = ImageFile(file_)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def geometries(geometry=POST_GEOMETRY):
+    """Геометрии для srcset: POST_IMAGE_WIDTHS с пропорциями geometry."""
+    width, height = map(int, geometry.split('x'))
+    widths = sorted({w for w in settings.POST_IMAGE_WIDTHS if w < width})
+    return [f'{w}x{round(height * w / width)}' for w in widths] + [geometry]
+
+
+def generate(name):
+    """Создаём все миниатюры поста."""
+    try:
+        for geometry in geometries():
+            get_thumbnail(ImageFile(name, post_images), geometry,
+                          **POST_THUMBNAIL_OPTIONS)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+
+
+def submit(job, name):
+    """Запускаем job(name) в пуле, если такая задача ещё не в очереди."""
+    if not name:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        job(name)
+        return
+    key = job, name
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    def run():
+        try:
+            job(name)
+        finally:
+            with _lock:
+                _pending.discard(key)
+            connections.close_all()
+
+    _get_executor().submit(run)
+
+
+def schedule(name):
+    """Ставим картинку в очередь на миниатюры, если её там ещё нет."""
+    submit(generate, name)
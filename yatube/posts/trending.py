@@ -0,0 +1,91 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from . import cache, counters
+from .models import Comment, Trending
+
+# Отметки прошлого запуска хранятся в Counter
+LAST_COMMENT = 'trending:last_comment'
+LAST_RUN = 'trending:last_run'
+# Область кэша страницы популярного
+SCOPE = 'trending'
+# Посты, чьи очки затухли ниже этого, из рейтинга выбывают
+MIN_SCORE = 0.01
+
+
+def reach(followers):
+    """Вес комментария по охвату автора: растёт медленно, от 1."""
+    return 1 + math.log1p(followers)
+
+
+def decay_factor(seconds):
+    half_life = settings.TRENDING_HALF_LIFE * 60 * 60
+    return 0.5 ** (max(seconds, 0) / half_life)
+
+
+def update(now=None):
+    """Один проход: затухание, новые комментарии, обрезка до верха.
+
+    Читаются только комментарии с id больше отметки прошлого запуска,
+    поэтому стоимость прохода зависит от числа новых комментариев,
+    а не от всей таблицы. Возвращает число обработанных комментариев.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        state = counters.read(LAST_COMMENT, LAST_RUN)
+        if state[LAST_RUN]:
+            factor = decay_factor(now.timestamp() - state[LAST_RUN])
+            Trending.objects.update(score=F('score') * factor)
+        last_id = state[LAST_COMMENT]
+        # Верхнюю границу фиксируем заранее: новые комментарии во время
+        # прохода достанутся следующему запуску
+        top_id = Comment.objects.filter(pk__gt=last_id).aggregate(
+            top=Max('pk'))['top']
+        processed = 0
+        if top_id is not None:
+            processed = _add_comments(last_id, top_id)
+            counters.store(LAST_COMMENT, top_id)
+        _trim()
+        counters.store(LAST_RUN, int(now.timestamp()))
+    cache.bump(SCOPE)
+    return processed
+
+
+def _add_comments(last_id, top_id):
+    # Comment.post допускает NULL: такие комментарии пропускаем, иначе
+    # Trending(post_id=None) падает и отметка больше не двигается
+    rows = list(
+        Comment.objects.filter(pk__gt=last_id, pk__lte=top_id,
+                               post__isnull=False)
+        .values('post_id', 'post__author_id').order_by()
+        .annotate(total=Count('pk')))
+    followers = counters.read(*{
+        counters.author_followers(row['post__author_id']) for row in rows})
+    gains = {
+        row['post_id']: row['total'] * reach(followers[
+            counters.author_followers(row['post__author_id'])])
+        for row in rows
+    }
+    existing = Trending.objects.in_bulk(list(gains))
+    for post_id, entry in existing.items():
+        entry.score += gains[post_id]
+    Trending.objects.bulk_update(existing.values(), ['score'],
+                                 batch_size=500)
+    Trending.objects.bulk_create(
+        (Trending(post_id=post_id, score=gain)
+         for post_id, gain in gains.items() if post_id not in existing),
+        batch_size=500)
+    return sum(row['total'] for row in rows)
+
+
+def _trim():
+    """Оставляем TRENDING_SIZE лучших и не затухших постов."""
+    Trending.objects.filter(score__lt=MIN_SCORE).delete()
+    cutoff = Trending.objects.values_list('score', flat=True)[
+        settings.TRENDING_SIZE - 1:settings.TRENDING_SIZE].first()
+    if cutoff is not None:
+        Trending.objects.filter(score__lt=cutoff).delete()
@@ -1,4 +1,4 @@
-from . import views
+from . import feeds, views
 
 from django.urls import path
 from django.conf import settings
@@ -29,7 +29,23 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
+    path('posts/<int:post_id>/comments/<int:comment_id>/replies/',
+         views.comment_replies, name='comment_replies'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('trending/', views.trending_posts, name='trending'),
+    path('search/', views.search_posts, name='search'),
+    # RSS и Atom для ленты, групп и авторов
+    path('feed/', feeds.index_rss, name='index_rss'),
+    path('feed/atom/', feeds.index_atom, name='index_atom'),
+    path('group/<slug:slug>/feed/', feeds.group_rss, name='group_rss'),
+    path('group/<slug:slug>/feed/atom/', feeds.group_atom,
+         name='group_atom'),
+    path('profile/<str:username>/feed/', feeds.author_rss,
+         name='profile_rss'),
+    path('profile/<str:username>/feed/atom/', feeds.author_atom,
+         name='profile_atom'),
 ]
 # Эта колдограмма будет работать,
 # когда ваш сайт в режиме отладки.
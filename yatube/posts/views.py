@@ -1,64 +1,171 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 from yatube.settings import QUANTITY
 
+from . import cache, counters, images, search, trending
+from .buffers import post_views, post_visitors, visitor_id
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
+from .models import Comment, Group, Post, User, Follow, Timeline
+from .paginators import (CountedPaginator, CursorPaginator, MergePaginator,
+                         TextCursorPaginator)
 
 
-def pagina(request, posts):
-    paginator = Paginator(posts, QUANTITY)
+def pagina(request, posts, count=None):
+    if count is None:
+        paginator = Paginator(posts, QUANTITY)
+    else:
+        # Число записей берём из счётчика, а не из COUNT(*)
+        paginator = CountedPaginator(posts, QUANTITY, count)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
 
 
-@cache_page(60 * 0.25)
+def feed_pagina(request, posts, counter):
+    # Курсорный режим: включается настройкой или токеном в адресе
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.CURSOR_PAGINATION or after or before:
+        return CursorPaginator(posts, QUANTITY).get_page(after, before)
+    return pagina(request, posts, counters.value(counter))
+
+
+@cache.cache_feed(lambda: [cache.INDEX])
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author', 'group')
     context = {
-        'page_obj': pagina(request, posts),
+        'page_obj': feed_pagina(request, posts, counters.POSTS),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache.cache_feed(lambda slug: [cache.group_scope(slug)])
 def posts_group(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author', 'group')
     context = {
         'group': group,
-        'page_obj': pagina(request, posts),
+        'page_obj': feed_pagina(request, posts,
+                                counters.group_posts(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cache.cache_feed(lambda username: [cache.author_scope(username)])
 def profile(request, username):
     author = User.objects.get(username=username)
-    posts = author.posts.all()
+    posts = author.posts.select_related('author', 'group')
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists())
     context = {
         'author': author,
-        'page_obj': pagina(request, posts),
+        'page_obj': feed_pagina(request, posts,
+                                counters.author_posts(author.pk)),
         'following': following,
+        **counters.author_stats(author.pk),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def detail_scopes(post_id):
+    # На странице поста есть число постов автора: его область тоже нужна
+    username = (Post.objects.filter(pk=post_id)
+                .values_list('author__username', flat=True).first())
+    return [cache.post_scope(post_id), cache.author_scope(username)]
+
+
+def comments_page(post, after=None, branch=None):
+    """Страница дерева комментариев в порядке обхода в глубину.
+
+    Один диапазон по индексу (post, path): всё дерево поста или
+    поддерево ответа branch. Показываем COMMENTS_EAGER_DEPTH уровней,
+    а у узлов на последнем из них отмечаем, сколько ответов скрыто.
+    """
+    comments = post.comments.select_related('author')
+    base_depth = 0
+    if branch is not None:
+        comments = comments.filter(path__gt=branch.path,
+                                   path__lt=branch.subtree_end)
+        base_depth = branch.depth + 1
+    edge = base_depth + settings.COMMENTS_EAGER_DEPTH - 1
+    paginator = TextCursorPaginator(comments.filter(depth__lte=edge),
+                                    settings.COMMENTS_PAGE_SIZE,
+                                    field='path', descending=False)
+    page = paginator.get_page(after)
+    hidden = dict(
+        Comment.objects.filter(
+            parent__in=[comment.pk for comment in page
+                        if comment.depth == edge])
+        .values('parent').order_by().annotate(total=Count('pk'))
+        .values_list('parent', 'total'))
+    for comment in page:
+        comment.hidden_replies = hidden.get(comment.pk, 0)
+    return page
+
+
+@cache.conditional(lambda post_id: [cache.post_scope(post_id)])
+def post_comments(request, post_id):
+    """Следующая страница комментариев HTML-фрагментом."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return render(request, 'includes/comment_list.html', {
+        'post': post,
+        'comments': comments_page(post, request.GET.get('after')),
+        'comments_url': request.path,
+    })
+
+
+@cache.conditional(
+    lambda post_id, comment_id: [cache.post_scope(post_id)])
+def comment_replies(request, post_id, comment_id):
+    """Глубокая ветка дерева: ответы на comment_id HTML-фрагментом."""
+    branch = get_object_or_404(
+        Comment.objects.select_related('post'), pk=comment_id,
+        post_id=post_id)
+    return render(request, 'includes/comment_list.html', {
+        'post': branch.post,
+        'comments': comments_page(branch.post, request.GET.get('after'),
+                                  branch),
+        'comments_url': request.path,
+    })
+
+
+def count_view(request, post_id):
+    """Просмотр и читатель поста: и при рендере, и при ответе 304."""
+    post = (Post.objects.filter(pk=post_id)
+            .values('group_id', 'author_id').first())
+    if post is None:
+        return
+    post_views.add(post_id)
+    post_visitors.add(visitor_id(request), post=post_id,
+                      group=post['group_id'], author=post['author_id'])
+
+
+# Число просмотров в ETag не входит: у клиента оно может отставать
+@cache.conditional(detail_scopes, csrf=True, on_request=count_view)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    # List of active comments for this post
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
     comment_form = CommentForm(request.POST or None)
     return render(request,
-                  'posts/post_detail.html', {'post': post,
-                                             'comments': comments,
-                                             'form': comment_form})
+                  'posts/post_detail.html', {
+                      'post': post,
+                      'views': post_views.live(post.pk, post.views),
+                      'comments': comments_page(post),
+                      'form': comment_form,
+                      'author_posts_count': counters.value(
+                          counters.author_posts(post.author_id)),
+                  })
 
 
+# Счётчики и Timeline пишут сигналы: в одной транзакции с записью,
+# иначе упавший приёмник оставил бы пост без них
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None)
@@ -67,11 +174,14 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if 'image' in form.changed_data:
+            images.schedule(post.image.name)
         return redirect('posts:profile', request.user.username)
     return render(request, 'posts/create_post.html', context)
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = PostForm(request.POST or None,
@@ -79,49 +189,155 @@ def post_edit(request, post_id):
                     instance=post)
     if post.author == request.user and form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            images.schedule(post.image.name)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html',
                   {'is_edit': True, 'form': form, })
 
 
+def reply_parent(request, post):
+    """Комментарий того же поста, на который отвечают; иначе None."""
+    parent_id = request.POST.get('parent', '')
+    if not parent_id.isdigit():
+        return None
+    return post.comments.filter(pk=parent_id).first()
+
+
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        comment.parent = reply_parent(request, post)
         comment.save()
+        if request.is_ajax():
+            # XHR-клиенту — только новый комментарий, без страницы поста
+            return render(request, 'includes/comment_item.html',
+                          {'comment': comment}, status=201)
         return redirect('posts:post_detail', post_id=post_id)
-    return render(request, 'posts/post_detail.html', {'post': post,
-                                                      'comments': comments,
-                                                      'form': form})
+    if request.is_ajax() and request.method == 'POST':
+        return JsonResponse({'errors': form.errors}, status=400)
+    return render(request, 'posts/post_detail.html', {
+        'post': post,
+        'views': post_views.live(post.pk, post.views),
+        'comments': comments_page(post),
+        'form': form,
+        'author_posts_count': counters.value(
+            counters.author_posts(post.author_id)),
+    })
 
 
 @login_required
 def follow_index(request):
-    follow = request.user.follower.all().values('author')
-    posts = Post.objects.filter(
-        author__in=follow).select_related('author')
-    post_list = [post for post in posts]
-    context = {'page_obj': pagina(request, post_list)}
+    if settings.FOLLOW_FEED_ENGINE == 'merge':
+        # Слияние лент авторов без материализованной Timeline
+        authors = request.user.follower.values_list('author', flat=True)
+        paginator = MergePaginator(
+            [Post.objects.filter(author_id=author).select_related(
+                'author', 'group')
+             for author in authors],
+            QUANTITY,
+        )
+        page_obj = paginator.get_page(request.GET.get('after'),
+                                      request.GET.get('before'))
+        return render(request, 'posts/follow.html', {'page_obj': page_obj})
+    # Лента уже разложена по Timeline при публикации и подписке
+    context = {'page_obj': timeline_pagina(request)}
     return render(request, 'posts/follow.html', context)
 
 
+def timeline_pagina(request):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.CURSOR_PAGINATION or after or before:
+        # Диапазон индекса (user, -pub_date, -id): N строк на страницу
+        entries = Timeline.objects.filter(user=request.user).select_related(
+            'post__author', 'post__group')
+        page_obj = CursorPaginator(entries, QUANTITY).get_page(after, before)
+        page_obj.object_list = [entry.post for entry in page_obj]
+        return page_obj
+    posts = Post.objects.filter(
+        timeline_entries__user=request.user
+    ).select_related('author', 'group').order_by(
+        '-timeline_entries__pub_date', '-timeline_entries__pk')
+    # В ленте все посты авторов из подписок: длина — сумма их счётчиков,
+    # без COUNT(*) по всей Timeline пользователя
+    authors = request.user.follower.values_list('author_id', flat=True)
+    count = sum(counters.read(
+        *(counters.author_posts(author) for author in authors)).values())
+    return pagina(request, posts, count)
+
+
+# INDEX: правка или удаление поста сбрасывает и эту страницу
+@cache.cache_feed(lambda: [trending.SCOPE, cache.INDEX])
+def trending_posts(request):
+    # Рейтинг уже посчитан командой update_trending: только чтение
+    posts = Post.objects.filter(trending__isnull=False).select_related(
+        'author', 'group').order_by('-trending__score', '-pk')
+    context = {'page_obj': pagina(request, posts)}
+    return render(request, 'posts/trending.html', context)
+
+
+@cache.cache_feed(lambda: [cache.INDEX])
+def search_posts(request):
+    """Поиск по FTS5-индексу: по релевантности, с подсветкой и курсором."""
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    results, next_cursor = [], None
+    if query:
+        filters = {}
+        if request.GET.get('group'):
+            group = Group.objects.filter(slug=request.GET['group']).first()
+            filters['group_id'] = group.pk if group else 0
+        if request.GET.get('author'):
+            author = User.objects.filter(
+                username=request.GET['author']).first()
+            filters['author_id'] = author.pk if author else 0
+        results, next_cursor = search.search(
+            query, QUANTITY, request.GET.get('after'), **filters)
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, rank, snippet in results])
+    found = []
+    for pk, rank, snippet in results:
+        # Пост могли удалить между двумя запросами
+        if pk in posts:
+            post = posts[pk]
+            post.rank, post.snippet = rank, snippet
+            found.append(post)
+    params = request.GET.copy()
+    params.pop('after', None)
+    if next_cursor:
+        params['after'] = next_cursor
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'posts': found,
+        'next_query': params.urlencode() if next_cursor else None,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
     if author != user:
-        if not Follow.objects.filter(author=author, user=user).exists():
-            Follow.objects.create(author=author, user=user)
+        # Повторную подписку не даёт уникальный индекс (user, author)
+        Follow.objects.get_or_create(author=author, user=user)
         return redirect('posts:profile', username=username)
     return redirect('posts:profile', username=username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follower = Follow.objects.filter(author=author,
@@ -0,0 +1,81 @@
+// Догружаем комментарии фрагментами и отправляем новые без перезагрузки.
+// Без JS ссылки и форма работают как обычно.
+(function () {
+  var container = document.getElementById('comments');
+  if (!container) {
+    return;
+  }
+  var headers = {'X-Requested-With': 'XMLHttpRequest'};
+  var form = document.querySelector('[data-comment-form]');
+
+  function load(url, place) {
+    return fetch(url, {headers: headers, credentials: 'same-origin'})
+      .then(function (response) { return response.text(); })
+      .then(place);
+  }
+
+  // Последний загруженный элемент поддерева комментария с путём path
+  function subtreeEnd(path) {
+    var last = null;
+    container.querySelectorAll('[data-path]').forEach(function (item) {
+      if (item.dataset.path.indexOf(path) === 0) {
+        last = item;
+      }
+    });
+    return last;
+  }
+
+  container.addEventListener('click', function (event) {
+    var more = event.target.closest('[data-comments-more]');
+    var branch = event.target.closest('[data-comments-branch]');
+    var reply = event.target.closest('[data-comment-reply]');
+    if (more) {
+      event.preventDefault();
+      load(more.href, function (html) { more.outerHTML = html; });
+    } else if (branch) {
+      // Ветка встаёт после своего комментария, а не внутрь него
+      event.preventDefault();
+      var item = branch.closest('[data-path]');
+      load(branch.href, function (html) {
+        item.insertAdjacentHTML('afterend', html);
+        branch.remove();
+      });
+    } else if (reply && form) {
+      event.preventDefault();
+      form.elements.parent.value = reply.dataset.commentReply;
+      form.elements.text.focus();
+    }
+  });
+
+  if (!form) {
+    return;
+  }
+  form.addEventListener('submit', function (event) {
+    event.preventDefault();
+    fetch(form.action, {
+      method: 'POST',
+      body: new FormData(form),
+      headers: headers,
+      credentials: 'same-origin'
+    }).then(function (response) {
+      if (response.status !== 201) {
+        form.submit();
+        return;
+      }
+      return response.text().then(function (html) {
+        var parent = document.getElementById(
+          'comment-' + form.elements.parent.value);
+        if (parent) {
+          // Ответ — последний в ветке родителя
+          subtreeEnd(parent.dataset.path).insertAdjacentHTML('afterend', html);
+        } else if (!container.querySelector('[data-comments-more]')) {
+          // Новый комментарий — последний; если загружены не все,
+          // он придёт с последней страницей
+          container.insertAdjacentHTML('beforeend', html);
+        }
+        form.reset();
+        form.elements.parent.value = '';
+      });
+    });
+  });
+})();
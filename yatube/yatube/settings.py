@@ -45,10 +45,12 @@ INSTALLED_APPS = [
     'users',
     'core',
     'about',
+    'api',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -143,8 +145,56 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # Константа количества страниц
 QUANTITY = 10
+# Курсорная пагинация лент (?after=/?before=) вместо номеров страниц
+CURSOR_PAGINATION = False
+# Движок ленты подписок: 'timeline' (материализованная) или 'merge'
+FOLLOW_FEED_ENGINE = 'timeline'
+# Сколько живут страницы лент: сбрасываются сигналами, а не по таймеру
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Сколько последних постов отдают RSS и Atom
+SYNDICATION_SIZE = 20
+# Размер страницы JSON API по умолчанию и предел для ?limit=
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 1000
+# Комментариев на странице поста и в каждой догружаемой порции
+COMMENTS_PAGE_SIZE = 20
+# Наибольшая глубина ответа (path вмещает не больше 24 уровней) и сколько
+# уровней дерева показываем сразу; глубже — догружаем по ссылке
+COMMENTS_MAX_DEPTH = 8
+COMMENTS_EAGER_DEPTH = 3
+# Почти дубли постов (MinHash): 'flag' помечает пост, 'reject' не даёт
+# его опубликовать. Похожесть — доля общих слов и пар слов (Жаккар);
+# короткие тексты не сравниваем: у них слишком мало признаков
+POST_DUPLICATES = 'flag'
+DUPLICATE_SIMILARITY = 0.7
+DUPLICATE_MIN_WORDS = 8
+# Популярное: сколько постов держим в рейтинге и за сколько часов
+# очки поста падают вдвое
+TRENDING_SIZE = 100
+TRENDING_HALF_LIFE = 6
+# Запросы дольше стольких миллисекунд попадают в лог core.middleware
+SLOW_REQUEST_THRESHOLD = 500
+# Потоки для фоновой нарезки миниатюр; 0 — делать их прямо в запросе
+THUMBNAIL_WORKERS = 2
+# Просмотры постов копятся в памяти и пишутся одним UPDATE, когда
+# набралось столько просмотров или прошло столько секунд
+VIEW_BUFFER_SIZE = 100
+VIEW_BUFFER_INTERVAL = 10
+# Уникальные читатели (HyperLogLog) пишутся такими же пачками
+VISITOR_BUFFER_SIZE = 500
+VISITOR_BUFFER_INTERVAL = 60
+# Метаданные миниатюр: LRU в памяти процесса перед общим кэшем и БД
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE = 1000
+# Загруженные картинки уменьшаются до стольких пикселей по большей стороне
+POST_IMAGE_MAX_SIDE = 2048
+# Ширины миниатюр карточки поста для srcset и атрибут sizes по умолчанию
+POST_IMAGE_WIDTHS = (320, 480, 640, 960)
+POST_IMAGE_SIZES = '(max-width: 992px) 100vw, 960px'
 # Чтобы отобразить ошибку 403
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+# Перед удалением тестовой базы сбрасываем в неё буферы счётчиков
+TEST_RUNNER = 'core.runner.BufferedRunner'
 # Указываем директорию куда картиночку закидывать
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
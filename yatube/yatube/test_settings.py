@@ -0,0 +1,6 @@
+"""Настройки для прогона внешних тестов (pytest)."""
+from .settings import *  # noqa: F401,F403
+
+# Миниатюры режутся прямо в запросе, чтобы фоновые потоки не писали
+# во временный MEDIA_ROOT после того, как тест его удалил
+THUMBNAIL_WORKERS = 0